@@ -0,0 +1,13 @@
+import os
+
+
+def write_atomic(path, data):
+    """Write str (as UTF-8) or bytes to path via a temp file, so readers never see a partial file"""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,136 @@
+"""Differential check and microbenchmark for the fast extractors.
+
+Runs parse_product_from_html over the saved product page fixtures twice:
+once as shipped (fast path with BeautifulSoup fallback) and once forcing the
+BeautifulSoup path, fails if the resulting dicts differ, and reports the
+per-page parse time of both. Category fixtures are checked the same way
+against the streaming ASIN scanner, fed in small chunks to exercise chunk
+boundaries, along with how many bytes it needed before it could stop.
+Finally each category's grid is listed as a category-only run would list
+it, checking that no gift card gets through to the page or the store.
+
+    python bench/bench_extract.py [--repeat N]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fetch_bestsellers
+from fast_extract import extract_product_fields, AsinScanner
+from product_store import ProductStore
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixtures(prefix):
+    fixtures = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.startswith(prefix) and name.endswith('.html'):
+            with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+def parse_with_soup_only(html_text, asin, url):
+    """parse_product_from_html with the fast path disabled"""
+    original = fetch_bestsellers.extract_product_fields
+    fetch_bestsellers.extract_product_fields = lambda html: None
+    try:
+        return fetch_bestsellers.parse_product_from_html(html_text, asin, url)
+    finally:
+        fetch_bestsellers.extract_product_fields = original
+
+
+def scan_in_chunks(html_bytes, limit, chunk_size):
+    scanner = AsinScanner(limit)
+    for i in range(0, len(html_bytes), chunk_size):
+        if scanner.feed(html_bytes[i:i + chunk_size]):
+            break
+    scanner.close()
+    return scanner.result(), scanner.bytes_scanned
+
+
+def list_category_only(html_bytes, limit, store):
+    """The products list_products picks from a category grid, as in an AMZ_CATEGORY_ONLY=1 run"""
+    scanner = AsinScanner(limit + fetch_bestsellers.CANDIDATE_SLACK, with_items=True)
+    scanner.feed(html_bytes)
+    scanner.close()
+    # Items the grid has no fields for would need their product page, which isn't checked here
+    grid = {asin: fields for asin, fields in scanner.items() if fields is not None}
+    ctx = fetch_bestsellers.RunContext(store=store, category_only=True)
+    return asyncio.run(fetch_bestsellers.list_products(None, list(grid), grid, limit, ctx))
+
+
+def best_time(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    asin, url = 'B000TEST00', 'https://www.amazon.se/dp/B000TEST00'
+    mismatches = 0
+    for name, html_text in load_fixtures('product_').items():
+        fast = fetch_bestsellers.parse_product_from_html(html_text, asin, url)
+        soup = parse_with_soup_only(html_text, asin, url)
+        path = 'fast' if extract_product_fields(html_text) else 'fallback'
+        if fast != soup:
+            mismatches += 1
+            print(f"MISMATCH {name}: fast={fast!r} soup={soup!r}")
+            continue
+
+        fast_t = best_time(lambda: fetch_bestsellers.parse_product_from_html(html_text, asin, url), args.repeat)
+        soup_t = best_time(lambda: parse_with_soup_only(html_text, asin, url), args.repeat)
+        print(f"{name:32} {path:8} {len(html_text) / 1024:6.0f} KB  "
+              f"fast {fast_t * 1000:8.2f} ms  soup {soup_t * 1000:8.2f} ms  "
+              f"x{soup_t / fast_t:.0f}")
+
+    for name, html_text in load_fixtures('category_').items():
+        html_bytes = html_text.encode('utf-8')
+        for limit in (12, 15, 50):
+            soup = fetch_bestsellers.parse_asins_soup(html_text, limit)
+            scanned, read = scan_in_chunks(html_bytes, limit, 997)
+            if scanned != soup:
+                mismatches += 1
+                print(f"MISMATCH {name} limit={limit}: scanner={scanned!r} soup={soup!r}")
+                continue
+            fast_t = best_time(lambda: scan_in_chunks(html_bytes, limit, 16 * 1024), args.repeat)
+            soup_t = best_time(lambda: fetch_bestsellers.parse_asins_soup(html_text, limit), args.repeat)
+            print(f"{name:26} limit={limit:<3} read {read / 1024:4.0f}/{len(html_bytes) / 1024:.0f} KB  "
+                  f"scan {fast_t * 1000:8.2f} ms  soup {soup_t * 1000:8.2f} ms  "
+                  f"x{soup_t / fast_t:.0f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ProductStore(os.path.join(tmp, 'products.sqlite'))
+        for name, html_text in load_fixtures('category_').items():
+            products = list_category_only(html_text.encode('utf-8'), 12, store)
+            store.commit()
+            titles = [p['title'] for p in products] + [t for t, in store.conn.execute("SELECT title FROM products")]
+            gift_cards = [t for t in titles if any(w in t.lower() for w in fetch_bestsellers.GIFT_CARD_WORDS)]
+            if gift_cards:
+                mismatches += 1
+                print(f"GIFT CARD {name}: {gift_cards!r} listed or stored in a category-only run")
+                continue
+            print(f"{name:26} category-only  {len(products)} listed, no gift cards")
+        store.close()
+
+    if mismatches:
+        print(f"{mismatches} fixture(s) differ between the fast path and BeautifulSoup")
+        sys.exit(1)
+    print("All fixtures give identical results on both paths")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""Offline end-to-end benchmark of fetch_bestsellers.main().
+
+Starts bench/server.py as a stand-in for amazon.se, runs main() against it
+and reports wall time, requests per second, p50/p95/p99 fetch latency, parse
+CPU time and peak RSS, plus the startup time of the module as measured by
+`python -X importtime`. Each run is measured in a fresh interpreter, as
+peak RSS is a high-water mark of the whole process. The result is compared
+with bench/baseline.json and the script exits non-zero when a metric
+regressed by more than --tolerance.
+
+    python bench/run_bench.py [--runs 3] [--latency 50] [--update-baseline]
+
+With --shards N, each run is N `fetch --shard i/N` processes, each with its
+own cache and product store, followed by `merge`; those runs are reported
+but not compared with the (single-process) baseline.
+
+The AMZ_* environment variables of fetch_bestsellers.py are passed through,
+e.g. AMZ_CATEGORY_ONLY=1 or AMZ_MARKETPLACES=se,de,uk,fr. The HTTP cache,
+incremental mode and thumbnails are off unless set explicitly, so every run
+is cold.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import contextlib
+import statistics
+import subprocess
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+# Metrics where a higher value is a regression
+COMPARED = ('wall_time_s', 'fetch_p95_ms', 'parse_cpu_s', 'peak_rss_mb', 'startup_ms')
+# Only imported once fetching starts, so `render` never loads them
+LAZY_MODULES = ('aiohttp', 'bs4', 'PIL')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_stats(base_url):
+    with urllib.request.urlopen(f'{base_url}/__stats') as r:
+        return json.load(r)
+
+
+@contextlib.contextmanager
+def stand_in_server(args):
+    """Run bench/server.py in a subprocess and yield its base URL"""
+    port = free_port()
+    cmd = [sys.executable, os.path.join(BENCH_DIR, 'server.py'), '--port', str(port),
+           '--latency', str(args.latency), '--jitter', str(args.jitter),
+           '--error-rate', str(args.error_rate), '--bandwidth', str(args.bandwidth),
+           '--subcategories', str(args.subcategories)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        for _ in range(100):
+            try:
+                server_stats(base_url)
+                break
+            except OSError:
+                time.sleep(0.05)
+        else:
+            raise RuntimeError('stand-in server did not start')
+        yield base_url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_once(fetch_bestsellers, base_url, out_dir, verbose):
+    before = server_stats(base_url)
+    start, cpu_start = time.perf_counter(), time.process_time()
+    out = sys.stdout if verbose else open(os.devnull, 'w')
+    with contextlib.redirect_stdout(out):
+        ctx = asyncio.run(fetch_bestsellers.main(base_url, out_dir))
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    after = server_stats(base_url)
+
+    requests = after['requests'] - before['requests']
+    latencies = [t * 1000 for t in ctx.fetch_latencies]
+    rss_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                 resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {
+        'wall_time_s': wall,
+        'requests': requests,
+        'requests_per_s': requests / wall if wall else 0.0,
+        'bytes_received': after['bytes_sent'] - before['bytes_sent'],
+        'fetch_p50_ms': percentile(latencies, 50),
+        'fetch_p95_ms': percentile(latencies, 95),
+        'fetch_p99_ms': percentile(latencies, 99),
+        'parse_cpu_s': ctx.parse_pool.cpu_time if ctx.parse_pool else 0.0,
+        'process_cpu_s': cpu,
+        'peak_rss_mb': rss_kb / 1024,
+    }
+
+
+def import_time(runs):
+    """Median import time of fetch_bestsellers in a fresh interpreter, and any LAZY_MODULES it loaded"""
+    times = []
+    eager = set()
+    for _ in range(runs):
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import fetch_bestsellers'],
+                                cwd=ROOT_DIR, capture_output=True, text=True).stderr
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative, name = line.split('|')
+            name = name.strip()
+            if name == 'fetch_bestsellers':
+                times.append(int(cumulative) / 1000)
+            elif name.split('.')[0] in LAZY_MODULES:
+                eager.add(name.split('.')[0])
+    return statistics.median(times), sorted(eager)
+
+
+# Per-process state, so the shards of a sharded run don't share caches or the product store
+SHARD_STATE = {'AMZ_PRODUCT_STORE': 'products.sqlite', 'AMZ_HTTP_CACHE_DIR': 'http',
+               'AMZ_FRAGMENT_CACHE': 'fragments.json', 'AMZ_JOURNAL': 'journal.jsonl',
+               'AMZ_IMAGE_MANIFEST': 'images.json', 'AMZ_RUN_REPORT': 'run-report.json',
+               'AMZ_PROM_TEXTFILE': 'bestsellers.prom'}
+
+
+def run_sharded(base_url, out_dir, shards, verbose):
+    """One sharded run: N fetch processes against the stand-in, then the merge"""
+    script = os.path.join(ROOT_DIR, 'fetch_bestsellers.py')
+    out = None if verbose else subprocess.DEVNULL
+    run_dir = tempfile.mkdtemp(prefix='sharded-', dir=out_dir)
+    env = dict(os.environ, AMZ_BASE_URL=base_url, AMZ_SHARD_DIR=os.path.join(run_dir, 'shards'),
+               AMZ_RUN_ID=os.path.basename(run_dir))
+    before = server_stats(base_url)
+    start = time.perf_counter()
+    procs = []
+    for i in range(shards):
+        state = {name: os.path.join(run_dir, f'shard-{i}', path) for name, path in SHARD_STATE.items()}
+        procs.append(subprocess.Popen([sys.executable, script, 'fetch', '--shard', f'{i}/{shards}',
+                                       '--out-dir', run_dir], env=dict(env, **state), stdout=out))
+    if any(proc.wait() != 0 for proc in procs):
+        raise RuntimeError('a shard failed')
+    subprocess.run([sys.executable, script, 'merge', '--out-dir', run_dir], env=env, stdout=out, check=True)
+    wall = time.perf_counter() - start
+    after = server_stats(base_url)
+
+    requests = after['requests'] - before['requests']
+    return {
+        'wall_time_s': wall,
+        'requests': requests,
+        'requests_per_s': requests / wall if wall else 0.0,
+        'bytes_received': after['bytes_sent'] - before['bytes_sent'],
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def measure(base_url, out_dir, args):
+    """One run (sharded with --shards) in a child interpreter, so its peak RSS is its own"""
+    result_path = os.path.join(out_dir, 'run-result.json')
+    cmd = [sys.executable, os.path.abspath(__file__), '--measure', base_url, '--result', result_path,
+           '--shards', str(args.shards)] + (['--verbose'] if args.verbose else [])
+    subprocess.run(cmd, check=True)
+    with open(result_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(result, baseline, tolerance):
+    regressions = []
+    for key in COMPARED:
+        if key in baseline and baseline[key] > 0 and result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {result[key]:.2f} vs baseline {baseline[key]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help='runs to take the median over')
+    parser.add_argument('--latency', type=float, default=50, help='server latency in ms')
+    parser.add_argument('--jitter', type=float, default=20, help='server jitter in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--bandwidth', type=int, default=2 * 1024 * 1024, help='bytes/s per response')
+    parser.add_argument('--subcategories', type=int, default=0, help='browse tree links per category page')
+    parser.add_argument('--shards', type=int, default=0, help='run as this many shard processes plus a merge')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--verbose', action='store_true', help='show the output of main()')
+    parser.add_argument('--measure', metavar='BASE_URL', help=argparse.SUPPRESS)  # see measure()
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        out_dir = os.path.dirname(args.result)
+        if args.shards:
+            result = run_sharded(args.measure, out_dir, args.shards, args.verbose)
+        else:
+            import fetch_bestsellers
+            result = run_once(fetch_bestsellers, args.measure, out_dir, args.verbose)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    out_dir = tempfile.mkdtemp(prefix='amz-bench-')
+    os.environ.setdefault('AMZ_HTTP_CACHE', '0')
+    os.environ.setdefault('AMZ_INCREMENTAL', '0')
+    os.environ.setdefault('AMZ_IMAGES', '0')
+    os.environ.setdefault('AMZ_PRODUCT_STORE', os.path.join(out_dir, 'products.sqlite'))
+    os.environ.setdefault('AMZ_HTTP_CACHE_DIR', os.path.join(out_dir, 'http'))
+    os.environ.setdefault('AMZ_FRAGMENT_CACHE', os.path.join(out_dir, 'fragments.json'))
+    os.environ.setdefault('AMZ_HISTORY_DIR', os.path.join(out_dir, 'history'))
+    os.environ.setdefault('AMZ_RUN_REPORT', os.path.join(out_dir, 'run-report.json'))
+    os.environ.setdefault('AMZ_PROM_TEXTFILE', os.path.join(out_dir, 'bestsellers.prom'))
+    os.environ.setdefault('AMZ_JOURNAL', os.path.join(out_dir, 'journal.jsonl'))
+
+    with stand_in_server(args) as base_url:
+        runs = [measure(base_url, out_dir, args) for _ in range(args.runs)]
+    result = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+    result['startup_ms'], eager = import_time(max(5, args.runs))
+
+    for key, value in result.items():
+        print(f"{key:16} {value:12.2f}")
+
+    if args.shards:
+        print("Sharded runs are not compared with the baseline")
+        return
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("No baseline yet, run with --update-baseline to record one")
+        return
+    regressions = compare(result, baseline, args.tolerance)
+    if eager:
+        regressions.append(f"imported at startup instead of when first needed: {', '.join(eager)}")
+    if regressions:
+        print("Regressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Local Amazon stand-in server for offline benchmarks.
+
+Serves the recorded category and product fixtures from bench/fixtures at the
+same paths as amazon.se (/gp/bestsellers/<dept>[?pg=N], /dp/<asin>), with
+configurable latency, jitter, error rate and bandwidth. ASINs on category
+pages are rewritten per department so that, like on the real site, only a
+configurable share of products ranks in more than one category. With
+--subcategories every category page links to that many subcategories.
+
+    python bench/server.py --port 8080 --latency 80 --jitter 40 --error-rate 0.02
+"""
+import os
+import re
+import zlib
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+CHUNK_SIZE = 16 * 1024
+ASIN_RE = re.compile(rb'B0[A-Z0-9]{8}')
+
+
+def load_fixtures(prefix):
+    fixtures = []
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.startswith(prefix) and name.endswith('.html'):
+            with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+                fixtures.append(f.read())
+    return fixtures
+
+
+def pick(fixtures, key):
+    """Stable choice of fixture for a path, so every run serves the same pages"""
+    return fixtures[zlib.crc32(key.encode('utf-8')) % len(fixtures)]
+
+
+def localise_asins(page, department, overlap):
+    """Give a department its own ASINs, keeping roughly `overlap` of them shared"""
+    def replace(m):
+        asin = m.group(0)
+        if zlib.crc32(asin) % 100 < overlap * 100:
+            return asin
+        digest = zlib.crc32(department.encode('utf-8') + asin)
+        return b'B0' + format(digest, '08X').encode('ascii')
+    return ASIN_RE.sub(replace, page)
+
+
+def browse_tree(path, children):
+    """Browse tree linking a list to `children` subcategories, so the tree never ends"""
+    department, _, node = path.partition('/')
+    links = ''.join(
+        f'<li><a href="/gp/bestsellers/{department}/{node}{i}/ref=zg_bs_nav_{department}_{i}">'
+        f'{department} {node}{i}</a></li>'
+        for i in range(1, children + 1)
+    )
+    return f'<div role="tree"><ul>{links}</ul></div>'.encode('utf-8')
+
+
+def make_app(latency=0.0, jitter=0.0, error_rate=0.0, bandwidth=0, seed=1, overlap=0.1,
+             subcategories=0):
+    """Build the stand-in app; latency and jitter in seconds, bandwidth in bytes/s (0 = unlimited)"""
+    categories = load_fixtures('category_')
+    products = load_fixtures('product_')
+    category_pages = {}
+    rng = random.Random(seed)
+    stats = {'requests': 0, 'errors': 0, 'bytes_sent': 0}
+
+    async def serve(request, body):
+        stats['requests'] += 1
+        delay = latency + rng.uniform(-jitter, jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if rng.random() < error_rate:
+            stats['errors'] += 1
+            return web.Response(status=503, text='Service Unavailable')
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/html; charset=utf-8'})
+        response.content_length = len(body)
+        try:
+            await response.prepare(request)
+            for i in range(0, len(body), CHUNK_SIZE):
+                chunk = body[i:i + CHUNK_SIZE]
+                await response.write(chunk)
+                stats['bytes_sent'] += len(chunk)
+                if bandwidth:
+                    await asyncio.sleep(len(chunk) / bandwidth)
+            await response.write_eof()
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass  # client stopped reading early
+        return response
+
+    async def category(request):
+        # Later pages of a list (?pg=2) get their own ASINs like a separate department
+        page = request.match_info['path']
+        if request.query.get('pg', '1') != '1':
+            page += '?pg=' + request.query['pg']
+        if page not in category_pages:
+            body = localise_asins(pick(categories, page), page, overlap)
+            if subcategories:
+                start = body.find(b'>', body.find(b'<body')) + 1
+                body = body[:start] + browse_tree(request.match_info['path'], subcategories) + body[start:]
+            category_pages[page] = body
+        return await serve(request, category_pages[page])
+
+    async def product(request):
+        return await serve(request, pick(products, request.match_info['asin']))
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app['stats'] = stats
+    app.router.add_get('/gp/bestsellers/{path:.*}', category)
+    app.router.add_get('/dp/{asin}', product)
+    app.router.add_get('/__stats', get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='ms before the first byte')
+    parser.add_argument('--jitter', type=float, default=0, help='+/- ms added to latency')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests answered 503')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes/s per response, 0 = unlimited')
+    parser.add_argument('--overlap', type=float, default=0.1, help='share of ASINs listed in several categories')
+    parser.add_argument('--subcategories', type=int, default=0, help='browse tree links per category page')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = make_app(args.latency / 1000, args.jitter / 1000, args.error_rate, args.bandwidth,
+                   args.seed, args.overlap, args.subcategories)
+    web.run_app(app, host=args.host, port=args.port, print=lambda *a: print(*a, flush=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import time
+import asyncio
+from collections import deque
+
+
+class _HostState:
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.waiters = deque()
+        self.min_latency = None
+        self.last_cut = 0.0
+        self.cuts = 0
+        self.peak_limit = float(limit)
+
+
+class AdaptiveLimiter:
+    """Per-host AIMD concurrency limit shared by every request of a run
+
+    Each healthy response grows a host's limit by about one slot per window
+    of requests. A throttling signal (429/503, timeout or robot check page)
+    halves it, at most once per observed round trip so a burst of failures
+    from the same window only counts once.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, decrease=0.5, slow_factor=3.0):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.slow_factor = slow_factor  # latency this many times the best seen stops growth
+        self.hosts = {}
+
+    def _host(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = _HostState(self.initial)
+        return state
+
+    async def acquire(self, host):
+        state = self._host(host)
+        if state.in_flight < int(state.limit) and not state.waiters:
+            state.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot(state)  # the slot was handed over just as we were cancelled
+            else:
+                state.waiters.remove(waiter)
+            raise
+
+    def release(self, host, outcome, latency=None):
+        """Give a slot back; outcome is 'ok', 'throttled' or 'neutral'"""
+        state = self._host(host)
+        now = time.monotonic()
+        if outcome == 'ok':
+            if latency is not None:
+                state.min_latency = latency if state.min_latency is None else min(state.min_latency, latency)
+            healthy = latency is None or latency <= state.min_latency * self.slow_factor
+            if healthy:
+                state.limit = min(self.max_limit, state.limit + 1.0 / state.limit)
+                state.peak_limit = max(state.peak_limit, state.limit)
+        elif outcome == 'throttled':
+            window = max(state.min_latency or 0.0, 0.1)
+            if now - state.last_cut >= window:
+                state.limit = max(self.min_limit, state.limit * self.decrease)
+                state.last_cut = now
+                state.cuts += 1
+        self._release_slot(state)
+
+    def _release_slot(self, state):
+        state.in_flight -= 1
+        while state.waiters and state.in_flight < int(state.limit):
+            waiter = state.waiters.popleft()
+            if not waiter.done():
+                state.in_flight += 1
+                waiter.set_result(None)
+
+    def summary(self):
+        parts = [
+            f"{host} limit {s.limit:.1f} (peak {s.peak_limit:.1f}, {s.cuts} cuts)"
+            for host, s in self.hosts.items()
+        ]
+        return "Concurrency: " + ("; ".join(parts) if parts else "no requests")
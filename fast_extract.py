@@ -0,0 +1,291 @@
+import re
+from html import unescape
+
+# Fast-path extraction of the few fields we need from an Amazon product page.
+# Instead of building a soup of the whole (very large) page, look up the
+# elements by id with plain string searches and precompiled patterns. Anything
+# unusual returns None so the caller can fall back to BeautifulSoup.
+
+_ID_PREFIX_RE = re.compile(r'\sid\s*=\s*["\']?$')
+_OPEN_TAG_RE = re.compile(r'<([a-zA-Z][\w-]*)((?:\s+[^>]*)?)>')
+_ATTR_RE = re.compile(r'([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+_IMG_TAG_RE = re.compile(r'<img\b((?:\s+[^>]*)?)>', re.I)
+
+
+def parse_attrs(attr_text):
+    """Parse the attribute part of a start tag into a dict, html.parser style"""
+    attrs = {}
+    for m in _ATTR_RE.finditer(attr_text):
+        name = m.group(1).lower()
+        if name in attrs:
+            continue
+        value = m.group(2)
+        if value is None:
+            value = m.group(3)
+        if value is None:
+            value = m.group(4)
+        attrs[name] = unescape(value) if value else ''
+    return attrs
+
+
+def find_tag_by_id(html, element_id, start=0):
+    """Return (tag_name, attrs, end_of_start_tag) for the first element with this id"""
+    needle = element_id
+    pos = html.find(needle, start)
+    while pos != -1:
+        after = html[pos + len(needle):pos + len(needle) + 1]
+        if after in ('"', "'", ' ', '>', '/') and _ID_PREFIX_RE.search(html, max(0, pos - 16), pos):
+            tag_start = html.rfind('<', 0, pos)
+            if tag_start != -1 and html.find('>', tag_start, pos) == -1:
+                m = _OPEN_TAG_RE.match(html, tag_start)
+                if m and m.end() > pos:
+                    attrs = parse_attrs(m.group(2))
+                    if attrs.get('id') == element_id:
+                        return m.group(1).lower(), attrs, m.end()
+        pos = html.find(needle, pos + len(needle))
+    return None
+
+
+def extract_title(html):
+    found = find_tag_by_id(html, 'productTitle')
+    if found is None:
+        return None
+    tag, _, content_start = found
+    content_end = html.find('<', content_start)
+    if content_end == -1 or not html.startswith('</' + tag, content_end):
+        return None  # nested markup, leave it to the full parser
+    return unescape(html[content_start:content_end]).strip()
+
+
+def extract_image(html):
+    found = find_tag_by_id(html, 'landingImage')
+    if found is not None:
+        return found[1].get('src') or None
+    found = find_tag_by_id(html, 'imgTagWrapperId')
+    if found is None:
+        return None
+    tag, _, content_start = found
+    m = _IMG_TAG_RE.search(html, content_start)
+    if m is None or html.find('</' + tag, content_start, m.start()) != -1:
+        return None
+    return parse_attrs(m.group(1)).get('src') or None
+
+
+def extract_product_fields(html):
+    """Return (title, img) from a product page, or None if the fast path can't tell"""
+    title = extract_title(html)
+    if not title:
+        return None
+    img = extract_image(html)
+    if img is None:
+        return None
+    return title, img
+
+
+# Streaming ASIN scanner for bestseller category pages. Works on raw bytes as
+# they arrive and keeps the rank order of the two-method soup parse: every
+# data-asin attribute in document order first, then /dp/ links from hrefs.
+# Like html.parser, it reads no tags inside comments, scripts and styles.
+
+_DATA_ASIN_RE = re.compile(rb'\sdata-asin\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>"\']+))')
+# href must follow whitespace, so data-href and the like don't count
+_HREF_RE = re.compile(rb'<[aA]\s(?:[^>]*?\s)?href\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>"\']+))')
+_HIDDEN_START_RE = re.compile(rb'<!--|<(script|style)\b[^>]*>', re.I)
+_HIDDEN_END_RE = {b'--': re.compile(rb'-->'), b'script': re.compile(rb'</script\s*>', re.I),
+                  b'style': re.compile(rb'</style\s*>', re.I)}
+_DP_RE = re.compile(rb'/dp/([A-Z0-9]{10})')
+
+
+class AsinScanner:
+    """Incremental ASIN extractor; feed() returns True once `limit` ASINs are certain
+
+    With with_items the page is kept and items() also returns the title and
+    thumbnail shown next to each data-asin element in the bestseller grid.
+    """
+
+    def __init__(self, limit, with_items=False):
+        self.limit = limit
+        self.with_items = with_items
+        self.data_asins = {}  # dicts keep insertion order and give O(1) dedup
+        self.link_asins = {}
+        self.tail = b''
+        self.bytes_scanned = 0
+        self.raw = bytearray()
+        self.offset = 0  # absolute position of the next region passed to _scan
+        self.boundaries = []  # start of every data-asin element, in document order
+        self.hidden = None  # end pattern of the comment, script or style being skipped
+
+    def feed(self, chunk):
+        if self.with_items:
+            self.raw += chunk
+        buf = self.tail + chunk
+        # Only scan up to the last complete tag, the rest waits for the next chunk
+        cut = buf.rfind(b'>') + 1
+        self.tail = buf[cut:]
+        self._scan(buf[:cut])
+        self.offset += cut
+        self.bytes_scanned += len(chunk)
+        return self.done()
+
+    def close(self):
+        if self.tail:
+            self._scan(self.tail)
+            self.offset += len(self.tail)
+            self.tail = b''
+
+    def done(self):
+        # Links never rank ahead of data-asin attributes, so only those can end the scan.
+        # Grid items also need the start of the next element to know where the last one ends.
+        if self.with_items:
+            return len(self.boundaries) > 0 and self._asins_before_last_boundary() >= self.limit
+        return len(self.data_asins) >= self.limit
+
+    def _asins_before_last_boundary(self):
+        last = self.boundaries[-1]
+        return sum(1 for pos in self.data_asins.values() if pos < last)
+
+    def _visible(self, data):
+        """(start, end) of the parts of data outside comments, scripts and styles
+
+        Regions are only cut at '>', which ends both their start and end
+        markers, so a marker is never split between two calls.
+        """
+        pos = 0
+        while pos < len(data):
+            if self.hidden is not None:
+                m = self.hidden.search(data, pos)
+                if m is None:
+                    return
+                self.hidden = None
+                pos = m.end()
+                continue
+            m = _HIDDEN_START_RE.search(data, pos)
+            if m is None:
+                yield pos, len(data)
+                return
+            yield pos, m.start()
+            self.hidden = _HIDDEN_END_RE[(m.group(1) or b'--').lower()]
+            pos = m.end()
+
+    def _scan(self, data):
+        for start, end in self._visible(data):
+            if not self.done():
+                for m in _DATA_ASIN_RE.finditer(data, start, end):
+                    value = m.group(1) or m.group(2) or m.group(3)
+                    pos = self.offset + m.start()
+                    self.boundaries.append(pos)
+                    if value:
+                        self.data_asins.setdefault(value.decode('utf-8', 'replace'), pos)
+                        if self.done():
+                            return
+            # Not capped: links that repeat a later data-asin don't count towards the limit
+            for m in _HREF_RE.finditer(data, start, end):
+                href = m.group(1) or m.group(2) or m.group(3) or b''
+                dp = _DP_RE.search(href)
+                if dp:
+                    self.link_asins.setdefault(dp.group(1).decode('ascii'), None)
+
+    def result(self):
+        asins = dict.fromkeys(self.data_asins)
+        for asin in self.link_asins:
+            if len(asins) >= self.limit:
+                break
+            asins.setdefault(asin, None)
+        return list(asins)[:self.limit]
+
+    def items(self):
+        """Return [(asin, (title, img) or None)] in rank order; needs with_items"""
+        items = []
+        for asin in self.result():
+            fields = None
+            start = self.data_asins.get(asin)
+            if start is not None:
+                i = self.boundaries.index(start)
+                end = self.boundaries[i + 1] if i + 1 < len(self.boundaries) else len(self.raw)
+                fields = extract_grid_item(bytes(self.raw[start:end]))
+            items.append((asin, fields))
+        return items
+
+
+_GRID_TITLE_RE = re.compile(r'<div class="[^"]*line-clamp[^"]*">([^<]+)</div>')
+
+
+def extract_grid_item(segment):
+    """Return (title, img) for one bestseller grid item, or None if it doesn't show both"""
+    html = segment.decode('utf-8', 'replace')
+    m = _IMG_TAG_RE.search(html)
+    if m is None:
+        return None
+    attrs = parse_attrs(m.group(1))
+    title = attrs.get('alt', '').strip()
+    if not title:
+        t = _GRID_TITLE_RE.search(html)
+        title = unescape(t.group(1)).strip() if t else ''
+    img = attrs.get('src')
+    if not title or not img:
+        return None
+    return title, img
+
+
+# Links in the bestseller browse tree: /gp/bestsellers/<department>/<node id>,
+# optionally absolute and followed by a /ref=... tracking suffix
+_SUBCATEGORY_RE = re.compile(
+    rb'<a\s(?:[^>]*?\s)?href\s*=\s*["\'](?:https?://[^/"\']+)?/gp/bestsellers/([\w-]+)/(\d+)[^"\']*["\'][^>]*>'
+    rb'\s*([^<]{1,200}?)\s*</a>')
+
+
+def extract_subcategories(html):
+    """Return [(path, name)] of the bestseller lists a category page links to, in page order"""
+    links = {}
+    for m in _SUBCATEGORY_RE.finditer(html):
+        path = b'/gp/bestsellers/%s/%s' % (m.group(1), m.group(2))
+        name = unescape(m.group(3).decode('utf-8', 'replace')).strip()
+        if name:
+            links.setdefault(path.decode('ascii'), name)
+    return list(links.items())
+
+
+# Streaming variant for product pages: watch the bytes as they arrive and only
+# decode and extract once the title element and main image tag are complete.
+
+_TITLE_ID_RE = re.compile(rb'\sid\s*=\s*["\']?productTitle\b')
+_IMAGE_ID_RE = re.compile(rb'\sid\s*=\s*["\']?landingImage\b')
+
+
+class ProductScanner:
+    """Incremental product extractor; feed() returns True once fields are found or the byte cap is hit"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.buf = bytearray()
+        self.fields = None
+        self.truncated = False
+        self._title_at = None
+        self._image_at = None
+        self._gave_up = False
+
+    def feed(self, chunk):
+        start = max(0, len(self.buf) - 64)  # overlap so a marker split across chunks is still found
+        self.buf += chunk
+        if not self._gave_up:
+            if self._title_at is None:
+                m = _TITLE_ID_RE.search(self.buf, start)
+                self._title_at = m.end() if m else None
+            if self._image_at is None:
+                m = _IMAGE_ID_RE.search(self.buf, start)
+                self._image_at = m.end() if m else None
+            if (self._title_at is not None and self._image_at is not None
+                    and self.buf.find(b'</', self._title_at) != -1
+                    and self.buf.find(b'>', self._image_at) != -1):
+                self.fields = extract_product_fields(self.text())
+                if self.fields is not None:
+                    return True
+                # Unusual markup: read on and leave it to the full parse at the end
+                self._gave_up = True
+        if len(self.buf) >= self.max_bytes:
+            self.truncated = True
+            return True
+        return False
+
+    def text(self):
+        return self.buf.decode('utf-8', 'replace')
@@ -1,63 +1,456 @@
 import os
 import re
+import sys
 import time
 import asyncio
-import aiohttp
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
-import functools
-
-# Define categories and their Amazon.se bestseller URLs
-CATEGORIES = {
-    "Beauty & Personal Care": "https://www.amazon.se/gp/bestsellers/beauty",
-    "Home & Kitchen": "https://www.amazon.se/gp/bestsellers/kitchen",
-    "Clothing, Shoes & Jewelry": "https://www.amazon.se/gp/bestsellers/fashion",
-    "Electronics": "https://www.amazon.se/gp/bestsellers/electronics",
-    "Toys & Games": "https://www.amazon.se/gp/bestsellers/toys",
-    "Books": "https://www.amazon.se/gp/bestsellers/books",
-    "Sports & Outdoors": "https://www.amazon.se/gp/bestsellers/sports",
-    "Health & Household": "https://www.amazon.se/gp/bestsellers/health",
-    "Tools & Home Improvement": "https://www.amazon.se/gp/bestsellers/industrial",
-    "Pet Supplies": "https://www.amazon.se/gp/bestsellers/pet-supplies"
-}
+import argparse
+import hashlib
+import subprocess
+from glob import glob
+from urllib.parse import urlsplit
+from http_cache import HttpCache
+from product_store import ProductStore
+from concurrency import AdaptiveLimiter
+from request_policy import RequestPolicy, RetryBudget
+from fetch_coordinator import FetchCoordinator
+from fragment_cache import FragmentCache, write_if_changed
+from static_shards import ShardWriter
+from marketplaces import MARKETPLACES
+from frontier import CrawlFrontier
+from run_metrics import RunMetrics
+from rank_history import RankHistory
+from rank_trends import compute_trends
+from run_journal import RunJournal
+from run_shards import ShardResult, parse_shard, merge_shards
+from fast_extract import extract_product_fields, extract_subcategories, AsinScanner, ProductScanner
+# aiohttp, BeautifulSoup, the parse pool and Pillow are imported where they are first
+# needed, so `render` starts without the network and parsing stack
+
+# Marketplaces to run, e.g. AMZ_MARKETPLACES=se,de,uk,fr; each gets its own output file
+MARKETPLACE_CODES = os.environ.get('AMZ_MARKETPLACES', 'se').split(',')
+DEFAULT_MARKETPLACE = MARKETPLACES['se']
+CATEGORIES = DEFAULT_MARKETPLACE.category_urls()
+BASE_URL = DEFAULT_MARKETPLACE.base_url
+ASSOCIATE_TAG = DEFAULT_MARKETPLACE.associate_tag
+
+# Fetch every marketplace from here instead, e.g. a stand-in server for benchmarks
+BASE_URL_OVERRIDE = os.environ.get('AMZ_BASE_URL') or None
 
-ASSOCIATE_TAG = 'amzing2025-21'
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
                   '(KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36'
 }
 
+# On-disk HTTP cache (set AMZ_HTTP_CACHE=0 to disable)
+HTTP_CACHE_ENABLED = os.environ.get('AMZ_HTTP_CACHE', '1') != '0'
+HTTP_CACHE_DIR = os.environ.get('AMZ_HTTP_CACHE_DIR', '.cache/http')
+
+# Incremental refresh: only fetch product pages for ASINs that are new or were
+# last seen more than AMZ_STALE_HOURS ago (set AMZ_INCREMENTAL=0 for a full refresh)
+PRODUCT_STORE_PATH = os.environ.get('AMZ_PRODUCT_STORE', '.cache/products.sqlite')
+INCREMENTAL = os.environ.get('AMZ_INCREMENTAL', '1') != '0'
+STALE_HOURS = float(os.environ.get('AMZ_STALE_HOURS', '72'))
+
+# Parse executor: 'thread' or 'process', defaults to a process pool sized to the cores
+PARSE_POOL_KIND = os.environ.get('AMZ_PARSE_POOL') or None
+PARSE_WORKERS = int(os.environ.get('AMZ_PARSE_WORKERS', '0')) or None
+
+# Local thumbnails: product images are downloaded once into images/ next to the
+# page and served as small WebP/JPEG variants (needs Pillow, AMZ_IMAGES=0 hotlinks)
+IMAGES_ENABLED = os.environ.get('AMZ_IMAGES', '1') != '0'
+IMAGE_MANIFEST_PATH = os.environ.get('AMZ_IMAGE_MANIFEST', '.cache/images.json')
+
+# Products listed per category. Bestseller lists go down to rank 100 at
+# PAGE_SIZE products per page (?pg=2, ...); deeper lists fetch their pages concurrently
+TOP_N = int(os.environ.get('AMZ_TOP_N', '12'))
+PAGE_SIZE = int(os.environ.get('AMZ_PAGE_SIZE', '50'))
+MAX_RANK = 100
+# Extra candidates ranked per category in case some are filtered out or fail
+CANDIDATE_SLACK = 3
+
+# Run report (JSON) and Prometheus textfile with per-stage and per-category timings
+RUN_REPORT_PATH = os.environ.get('AMZ_RUN_REPORT', '.cache/run-report.json')
+PROM_TEXTFILE_PATH = os.environ.get('AMZ_PROM_TEXTFILE', '.cache/bestsellers.prom')
+
+# Every run's rankings are appended to a columnar history (needs numpy), see rank_history.py
+HISTORY_ENABLED = os.environ.get('AMZ_HISTORY', '1') != '0'
+HISTORY_DIR = os.environ.get('AMZ_HISTORY_DIR', '.cache/history')
+
+# Completed fetches are journaled here, so a killed run can be picked up with --resume
+JOURNAL_PATH = os.environ.get('AMZ_JOURNAL', '.cache/journal.jsonl')
+
+# Where `fetch --shard i/N` writes its part of the run and `merge` looks for them
+SHARD_DIR = os.environ.get('AMZ_SHARD_DIR', '.cache/shards')
+# Given to all shards of one run (e.g. the CI run id) so merge can tell them from leftovers of other runs
+RUN_ID = os.environ.get('AMZ_RUN_ID', '')
+
+# Subcategory crawl: follow the browse tree of each department's bestseller page
+# down to CRAWL_DEPTH levels (0 = departments only), listing at most
+# CRAWL_MAX_PAGES category pages per marketplace, CRAWL_CONCURRENCY at a time
+CRAWL_DEPTH = int(os.environ.get('AMZ_CRAWL_DEPTH', '0'))
+CRAWL_MAX_PAGES = int(os.environ.get('AMZ_CRAWL_MAX_PAGES', '1000'))
+CRAWL_FRONTIER = int(os.environ.get('AMZ_CRAWL_FRONTIER', '2000'))
+CRAWL_CONCURRENCY = int(os.environ.get('AMZ_CRAWL_CONCURRENCY', '8'))
+
+# Category-page-only mode: take title and thumbnail straight from the bestseller
+# grid and only fetch product pages for items the grid doesn't resolve
+CATEGORY_ONLY = os.environ.get('AMZ_CATEGORY_ONLY', '0') == '1'
+
+# Concurrency per host adapts between these bounds (AIMD), see concurrency.py
+INITIAL_CONCURRENCY = int(os.environ.get('AMZ_INITIAL_CONCURRENCY', '4'))
+MAX_CONCURRENCY = int(os.environ.get('AMZ_MAX_CONCURRENCY', '32'))
+# Responses that mean we are being throttled, and those worth another try
+THROTTLE_STATUSES = (429, 503)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Retries with backoff and jitter, one retry budget per run shared by all
+# marketplaces, and optional hedged requests fired once a request outlives
+# the observed p95 latency
+MAX_ATTEMPTS = int(os.environ.get('AMZ_MAX_ATTEMPTS', '3'))
+RETRY_BUDGET = int(os.environ.get('AMZ_RETRY_BUDGET', '60'))
+HEDGE_REQUESTS = os.environ.get('AMZ_HEDGE', '0') == '1'
+
+# Product workers draining the shared queue; the limiter decides how many of
+# their requests are actually in flight
+PRODUCT_WORKERS = int(os.environ.get('AMZ_PRODUCT_WORKERS', str(MAX_CONCURRENCY)))
+
+# Extra candidates kept in flight beyond a category's quota, so a failed or
+# filtered product (e.g. a gift card) doesn't stall the category
+QUOTA_LOOKAHEAD = int(os.environ.get('AMZ_QUOTA_LOOKAHEAD', '1'))
+
+# Size of the reads when streaming a response body
+CHUNK_SIZE = 16 * 1024
+
+# Product pages are streamed and the connection closed once the title and main
+# image are found (AMZ_STREAM_PRODUCTS=0 downloads them in full). Nothing past
+# AMZ_MAX_PRODUCT_BYTES of a product page is ever read.
+STREAM_PRODUCTS = os.environ.get('AMZ_STREAM_PRODUCTS', '1') != '0'
+MAX_PRODUCT_BYTES = int(os.environ.get('AMZ_MAX_PRODUCT_BYTES', str(1536 * 1024)))
+
+# Rendered category and product fragments reused between runs
+FRAGMENT_CACHE_PATH = os.environ.get('AMZ_FRAGMENT_CACHE', '.cache/fragments.json')
+# 'inline' renders every product into the page; 'shards' writes a small shell page plus
+# one content-hashed, precompressed JSON file per category under data/, loaded on scroll
+OUTPUT_MODE = os.environ.get('AMZ_OUTPUT', 'inline')
+
+class RunContext:
+    """Per-run state shared by the fetch helpers"""
+
+    def __init__(self, cache=None, store=None, max_age=None, parse_pool=None,
+                 category_only=False, base_url=BASE_URL, limiter=None, policy=None,
+                 coordinator=None, product_queue=None, images=None, market=None, metrics=None,
+                 history=None, journal=None, shard=None, retry_budget=None):
+        self.cache = cache
+        self.store = store
+        self.max_age = max_age  # None means every product page is refetched
+        self.parse_pool = parse_pool
+        self.category_only = category_only
+        self.base_url = base_url
+        self.limiter = limiter
+        self.policy = policy
+        self.coordinator = coordinator
+        self.product_queue = product_queue  # feeds product_worker tasks when set
+        self.quota_stats = {'skipped': 0, 'cancelled': 0}
+        self.images = images
+        self.market = market or DEFAULT_MARKETPLACE
+        self.metrics = metrics
+        self.history = history
+        self.journal = journal
+        self.shard = shard  # a ShardResult when this process runs one shard of the categories
+        self.retry_budget = retry_budget  # shared by the request policies of all marketplaces
+        self.fetch_latencies = []  # seconds per network fetch, for benchmarks
+
+    def for_market(self, market, base_url, limiter, policy):
+        """Context for one marketplace: own limiter and request policy, shared pool, caches, stats and retry budget"""
+        ctx = RunContext(cache=self.cache, store=self.store, max_age=self.max_age,
+                         parse_pool=self.parse_pool, category_only=self.category_only,
+                         base_url=base_url, limiter=limiter, policy=policy,
+                         coordinator=self.coordinator, images=self.images, market=market,
+                         metrics=self.metrics, history=self.history, journal=self.journal,
+                         shard=self.shard, retry_budget=self.retry_budget)
+        ctx.quota_stats = self.quota_stats
+        ctx.fetch_latencies = self.fetch_latencies
+        return ctx
+
+    async def parse(self, fn, *args):
+        """Run a parse function on the shared pool, or inline when there is none"""
+        if self.parse_pool is None:
+            start = time.thread_time()
+            result = fn(*args)
+            if self.metrics is not None:
+                self.metrics.observe('parse', fn.__name__, time.thread_time() - start)
+            return result
+        return await self.parse_pool.run(fn, *args)
+
+    def close_market(self):
+        """Print the statistics of the per-marketplace parts"""
+        if self.limiter is not None:
+            print(f"[{self.market.code}] {self.limiter.summary()}")
+        if self.policy is not None:
+            print(f"[{self.market.code}] {self.policy.summary()}")
+
+    def close(self):
+        self.close_market()
+        if self.coordinator is not None:
+            print(self.coordinator.summary())
+        if self.retry_budget is not None:
+            print(self.retry_budget.summary())
+        print(f"Category quotas: {self.quota_stats['skipped']} candidates never fetched, "
+              f"{self.quota_stats['cancelled']} fetches cancelled")
+        if self.metrics is not None:
+            print(self.metrics.summary())
+        if self.history is not None:
+            print(self.history.summary())
+        if self.journal is not None:
+            print(self.journal.summary())
+        if self.images is not None:
+            self.images.save()
+            print(self.images.summary())
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+            print(self.parse_pool.summary())
+        if self.cache is not None:
+            self.cache.save()
+            print(self.cache.summary())
+        if self.store is not None:
+            self.store.close()
+            print(self.store.summary())
+
 # Async HTTP session
-async def create_session():
+async def create_session(market=None, metrics=None):
+    import aiohttp
     timeout = aiohttp.ClientTimeout(total=20)
-    connector = aiohttp.TCPConnector(limit=20, limit_per_host=5)  # Connection pooling
+    # Connection pooling, one pool per marketplace; per-host concurrency is left to the adaptive limiter
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY, limit_per_host=0)
+    headers = HEADERS if market is None else dict(HEADERS, **{'Accept-Language': market.accept_language})
     return aiohttp.ClientSession(
-        headers=HEADERS, 
+        trace_configs=[metrics.trace_config()] if metrics is not None else None,
+        headers=headers, 
         timeout=timeout, 
         connector=connector
     )
 
-async def get_top_asins(session, url, limit=12):
-    """Async version of get_top_asins"""
+class FetchResult:
+    """Outcome of one fetch attempt"""
+
+    def __init__(self, body=None, scanner=None, retryable=False):
+        self.body = body
+        self.scanner = scanner
+        self.retryable = retryable
+
+def should_retry(result):
+    return result.body is None and result.retryable
+
+async def fetch_page(session, url, kind, ctx=None, make_scanner=None, cache_partial=False):
+    """GET a page through the HTTP cache, returning (body bytes or None, scanner)
+
+    With make_scanner each attempt feeds a fresh scanner chunk by chunk as the
+    body arrives, and the download stops as soon as feed() returns True; the
+    scanner of the attempt that produced the body is returned. A body cut
+    short that way is only cached with cache_partial, for callers whose
+    scanner always stops at the same point.
+    """
+    cache = ctx.cache if ctx is not None else None
+    headers = {}
+    if cache is not None:
+        body, headers = cache.lookup(url, kind)
+        if body is not None:
+            scanner = make_scanner() if make_scanner is not None else None
+            if scanner is not None:
+                observe_scan(ctx, scanner, feed_timed(scanner, body)[1])
+            return body, scanner
+
+    async def attempt(started):
+        return await fetch_once(session, url, kind, ctx, headers, make_scanner, cache_partial, started)
+
+    policy = ctx.policy if ctx is not None else None
+    if policy is None:
+        result = await attempt(lambda: None)
+    else:
+        result = await policy.run(attempt, should_retry)
+    return result.body, result.scanner
+
+async def fetch_once(session, url, kind, ctx, headers, make_scanner, cache_partial, started):
+    """A single request for fetch_page, paced by the run's limiter; calls started() once it goes out"""
+    cache = ctx.cache if ctx is not None else None
+    limiter = ctx.limiter if ctx is not None else None
+    metrics = ctx.metrics if ctx is not None else None
+    scanner = make_scanner() if make_scanner is not None else None
+    host = urlsplit(url).netloc
+    if limiter is not None:
+        await limiter.acquire(host)
+    started()
+    outcome, latency = 'neutral', None
+    start = time.perf_counter()
     try:
-        async with session.get(url) as response:
+        async with session.get(url, headers=headers, trace_request_ctx={'kind': kind}) as response:
+            latency = time.perf_counter() - start
+            if ctx is not None:
+                ctx.fetch_latencies.append(latency)
+            if response.status == 304 and cache is not None:
+                outcome = 'ok'
+                body = cache.revalidated(url)
+                if body is None:
+                    # Stored body went missing, the retry goes out unconditionally
+                    headers.clear()
+                    return FetchResult(retryable=True)
+                if scanner is not None:
+                    observe_scan(ctx, scanner, feed_timed(scanner, body)[1])
+                return FetchResult(body, scanner)
             if response.status != 200:
-                print(f"Failed to fetch category page: {url}, status: {response.status}")
-                return []
-            text = await response.text()
+                print(f"Failed to fetch {kind} page: {url}, status: {response.status}")
+                if metrics is not None:
+                    metrics.failure(kind, f'status {response.status}')
+                if response.status in THROTTLE_STATUSES:
+                    outcome = 'throttled'
+                return FetchResult(retryable=response.status in RETRY_STATUSES)
+            scanned = 0.0
+            if scanner is None:
+                body = await response.read()
+                complete = True
+            else:
+                chunks = []
+                complete = True
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    chunks.append(chunk)
+                    done, cpu = feed_timed(scanner, chunk)
+                    scanned += cpu
+                    if done:
+                        complete = response.content.at_eof()
+                        break
+                body = b''.join(chunks)
+                observe_scan(ctx, scanner, scanned)
+            if metrics is not None:
+                metrics.observe('download', kind, time.perf_counter() - start - latency - scanned)
+            if is_robot_check(body):
+                print(f"Failed to fetch {kind} page: {url}, robot check")
+                if metrics is not None:
+                    metrics.failure(kind, 'robot check')
+                outcome = 'throttled'
+                return FetchResult(retryable=True)
+            outcome = 'ok'
+            if cache is not None and (complete or cache_partial):
+                cache.store(url, body, response.headers)
+            return FetchResult(body, scanner)
     except Exception as e:
-        print(f"Failed to fetch category page: {url}", e)
+        print(f"Failed to fetch {kind} page: {url}", e)
+        if metrics is not None:
+            metrics.failure(kind, type(e).__name__)
+        outcome = 'throttled'
+        return FetchResult(retryable=True)
+    finally:
+        if limiter is not None:
+            limiter.release(host, outcome, latency)
+
+def feed_timed(scanner, data):
+    """scanner.feed(data) and the CPU seconds it took; returns (done, seconds)"""
+    start = time.thread_time()
+    done = scanner.feed(data)
+    return done, time.thread_time() - start
+
+def observe_scan(ctx, scanner, seconds):
+    # Scanners parse inline on the event loop, not through ctx.parse, so they are timed here, once per page
+    if ctx is not None and ctx.metrics is not None:
+        ctx.metrics.observe('parse', type(scanner).__name__, seconds)
+
+def is_robot_check(body):
+    """Amazon answers throttled clients with a captcha page instead of the content"""
+    return b'/errors/validateCaptcha' in body or b'<title dir="ltr">Robot Check</title>' in body
+
+async def get_top_asins(session, url, limit=12, ctx=None):
+    """Async version of get_top_asins, scanning ASINs while the page downloads"""
+    body, scanner = await fetch_page(session, url, 'category', ctx, lambda: AsinScanner(limit))
+    if body is None:
         return []
+    scanner.close()
+    return scanner.result()
+
+async def get_top_items(session, url, limit=12, ctx=None):
+    """Like get_top_asins, but returns [(asin, (title, img) or None)] from the grid"""
+    body, scanner = await fetch_page(session, url, 'category', ctx,
+                                     lambda: AsinScanner(limit, with_items=True))
+    if body is None:
+        return []
+    scanner.close()
+    return scanner.items()
+
+def page_url(url, page):
+    """URL of the given 1-based page of a bestseller list"""
+    if page == 1:
+        return url
+    return f"{url}{'&' if '?' in url else '?'}pg={page}"
 
-    # Use ThreadPoolExecutor for CPU-bound parsing
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        asins = await loop.run_in_executor(executor, parse_asins_from_html, text, limit)
+async def get_ranked(session, url, limit, ctx=None, with_items=False, first_page=None):
+    """Top `limit` entries of a bestseller list, fetching all its pages concurrently
+
+    Returns ASINs, or get_top_items pairs with with_items, merged in rank
+    order: page by page, an ASIN listed twice keeps its better rank.
+    first_page, the entries of page 1 when it was already fetched (see
+    scan_list_page), saves fetching it again.
+    """
+    journal = ctx.journal if ctx is not None else None
+    if journal is not None:
+        key = f'{ctx.market.code}:{url}:{limit}:{int(with_items)}'
+        ranked = journal.get('ranked', key)
+        if ranked is not None:
+            return ranked
+    pages = max(1, -(-min(limit, MAX_RANK) // PAGE_SIZE))
+    fetch = get_top_items if with_items else get_top_asins
+    
+    async def entries(page):
+        if page == 1 and first_page is not None:
+            return first_page
+        return await fetch(session, page_url(url, page), min(PAGE_SIZE, limit - (page - 1) * PAGE_SIZE), ctx)
     
-    return asins
+    results = await asyncio.gather(*(entries(page) for page in range(1, pages + 1)))
+    merged = {}
+    for entries in results:
+        for entry in entries:
+            merged.setdefault(entry[0] if with_items else entry, entry)
+    ranked = list(merged.values())[:limit]
+    if journal is not None and ranked:
+        journal.record('ranked', key, ranked)
+    return ranked
+
+async def get_subcategories(session, url, ctx=None):
+    """([(path, name)] of the bestseller lists in a category page's browse tree, the page's body)
+
+    The body (None when the links were replayed from the journal) is the
+    list's first page in full, so the list's ranking can be read from it
+    instead of fetching the page again.
+    """
+    if ctx is not None and ctx.journal is not None:
+        links = ctx.journal.get('links', f'{ctx.market.code}:{url}')
+        if links is not None:
+            return links, None
+    body, _ = await fetch_page(session, url, 'category', ctx)
+    if body is None:
+        return [], None
+    if ctx is None:
+        return extract_subcategories(body), body
+    links = await ctx.parse(extract_subcategories, body)
+    if ctx.journal is not None:
+        ctx.journal.record('links', f'{ctx.market.code}:{url}', links)
+    return links, body
+
+def scan_list_page(body, limit, ctx=None):
+    """The page 1 entries process_category(limit) ranks a list by, scanned from a fetched body"""
+    with_items = ctx is not None and ctx.category_only
+    scanner = AsinScanner(min(PAGE_SIZE, limit + CANDIDATE_SLACK), with_items)
+    observe_scan(ctx, scanner, feed_timed(scanner, body)[1])
+    scanner.close()
+    return scanner.items() if with_items else scanner.result()
 
 def parse_asins_from_html(html_text, limit):
-    """Parse ASINs from HTML (CPU-bound, runs in thread pool)"""
+    """Parse ASINs from a complete category page with the streaming scanner"""
+    scanner = AsinScanner(limit)
+    scanner.feed(html_text.encode('utf-8') if isinstance(html_text, str) else html_text)
+    scanner.close()
+    return scanner.result()
+
+def parse_asins_soup(html_text, limit):
+    """Reference BeautifulSoup parse of the ASINs on a category page"""
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html_text, 'html.parser')
     asins = []
     
@@ -82,81 +475,311 @@ def parse_asins_from_html(html_text, limit):
 
     return asins[:limit]
 
-async def fetch_product_basic(session, asin):
+def rebase_url(url, base_url):
+    """Move an amazon.se URL onto another base URL, keeping path and query"""
+    parts = urlsplit(url)
+    return base_url.rstrip('/') + parts.path + (f'?{parts.query}' if parts.query else '')
+
+def product_url(asin, base_url=BASE_URL):
+    return f'{base_url}/dp/{asin}'
+
+async def fetch_product_basic(session, asin, ctx=None):
     """Async version of fetch_product_basic"""
-    url = f'https://www.amazon.se/dp/{asin}'
-    try:
-        async with session.get(url) as response:
-            if response.status != 200:
-                print(f"Failed to fetch product page: {url}, status: {response.status}")
-                return None
-            text = await response.text()
-    except Exception as e:
-        print(f"Failed to fetch product page: {url}", e)
-        return None
+    url = product_url(asin, ctx.base_url if ctx is not None else BASE_URL)
+    if STREAM_PRODUCTS:
+        body, scanner = await fetch_page(session, url, 'product', ctx,
+                                         lambda: ProductScanner(MAX_PRODUCT_BYTES),
+                                         cache_partial=True)
+        if body is None:
+            return None
+        if scanner.fields is not None:
+            return make_product(asin, url, *scanner.fields)
+        text = scanner.text()
+    else:
+        body, _ = await fetch_page(session, url, 'product', ctx)
+        if body is None:
+            return None
+        text = body.decode('utf-8', 'replace')
 
-    # Use ThreadPoolExecutor for CPU-bound parsing
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        product_data = await loop.run_in_executor(
-            executor, parse_product_from_html, text, asin, url
-        )
-    
-    return product_data
+    if ctx is None:
+        return parse_product_from_html(text, asin, url)
+    return await ctx.parse(parse_product_from_html, text, asin, url)
 
 def parse_product_from_html(html_text, asin, url):
-    """Parse product data from HTML (CPU-bound, runs in thread pool)"""
+    """Parse product data from HTML (CPU-bound, runs on the parse pool)"""
+    fields = extract_product_fields(html_text)
+    if fields is None:
+        fields = parse_product_fields_soup(html_text, asin)
+    return make_product(asin, url, *fields)
+
+# Gift cards rank high everywhere but aren't worth listing, in any marketplace's language
+GIFT_CARD_WORDS = ('gift card', 'presentkort', 'geschenkkarte', 'geschenkgutschein', 'carte cadeau')
+
+def make_product(asin, url, title, img):
+    """Build the product dict, or None for products we don't list"""
+    # Skip gift cards
+    lowered = title.lower()
+    if any(word in lowered for word in GIFT_CARD_WORDS):
+        return None
+    
+    return {'asin': asin, 'title': title, 'img': img, 'url': url}
+
+def parse_product_fields_soup(html_text, asin):
+    """Full BeautifulSoup parse, used when the fast extractor can't find the fields"""
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html_text, 'html.parser')
     
     title_tag = soup.find(id='productTitle') or soup.find('span', class_='a-size-large')
     title = title_tag.get_text(strip=True) if title_tag else asin
     
-    # Skip gift cards
-    if 'gift card' in title.lower() or 'presentkort' in title.lower():
-        return None
-    
     img = None
     img_tag = soup.find(id='landingImage') or soup.select_one('#imgTagWrapperId img')
     if img_tag and img_tag.get('src'):
         img = img_tag['src']
     
-    return {'asin': asin, 'title': title, 'img': img, 'url': url}
+    return title, img
+
+async def process_category(session, category, url, limit=TOP_N, ctx=None, key=None, first_page=None):
+    """Process a single category asynchronously
 
-async def process_category(session, category, url, limit=12):
-    """Process a single category asynchronously"""
+    key identifies the list in the rank history when its name isn't stable
+    (crawled lists are keyed by their path); it defaults to the name.
+    first_page is passed on to get_ranked.
+    """
     print(f"Processing category: {category}")
-    asins = await get_top_asins(session, url, limit=15)
+    started = time.perf_counter()
+    grid = {}
+    candidates = limit + CANDIDATE_SLACK
+    if ctx is not None and ctx.category_only:
+        grid = dict(await get_ranked(session, url, candidates, ctx, with_items=True, first_page=first_page))
+        asins = list(grid)
+    else:
+        asins = await get_ranked(session, url, candidates, ctx, first_page=first_page)
     
     if not asins:
-        return category, []
+        products = []
+    else:
+        products = await list_products(session, asins, grid, limit, ctx)
     
-    # Process products concurrently with controlled concurrency
-    semaphore = asyncio.Semaphore(5)  # Limit concurrent requests
+    if ctx is not None and ctx.history is not None and products:
+        ranks = {asin: rank for rank, asin in enumerate(asins, 1)}
+        ctx.history.add(f'{ctx.market.code}/{key or category}', [(ranks[p['asin']], p['asin']) for p in products],
+                        label=category if key else None)
+    if ctx is not None and ctx.metrics is not None:
+        ctx.metrics.category(ctx.market.code, category, time.perf_counter() - started, len(products))
+    return category, products
+
+async def list_products(session, asins, grid, limit, ctx=None):
+    """Resolve ranked ASINs to the first `limit` listable products"""
+    # Known products that are still fresh need no product page request
+    known = {}
+    if ctx is not None and ctx.store is not None and ctx.max_age is not None:
+        known = ctx.store.get_fresh(asins, ctx.max_age, ctx.market.code)
     
-    async def fetch_with_semaphore(asin):
-        async with semaphore:
-            return await fetch_product_basic(session, asin)
+    # Resolve what we can locally, the rest goes to the shared product workers
+    # (or is fetched right here when the run has no pipeline)
+    queue = ctx.product_queue if ctx is not None else None
+    loop = asyncio.get_running_loop()
     
-    # Fetch all products concurrently
-    tasks = [fetch_with_semaphore(asin) for asin in asins]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    async def submit(asin):
+        if grid.get(asin) is not None:
+            product = make_product(asin, product_url(asin, ctx.base_url), *grid[asin])
+            if product is not None and ctx.store is not None:
+                ctx.store.upsert(product, ctx.market.code)  # so render has it too
+        elif asin in known:
+            product = known[asin]
+        elif queue is not None:
+            future = loop.create_future()
+            await queue.put((asin, future))
+            return future
+        else:
+            return asyncio.ensure_future(fetch_product(session, asin, ctx))
+        future = loop.create_future()
+        future.set_result(product)
+        return future
     
-    # Filter successful results and limit to 12
-    products = []
-    for result in results:
-        if isinstance(result, dict) and result is not None:
-            products.append(result)
-        if len(products) >= limit:
-            break
+    # Fetch in rank order until the first `limit` valid products are certain
+    stats = ctx.quota_stats if ctx is not None else None
+    products = await first_valid(asins, limit, QUOTA_LOOKAHEAD, submit, stats)
     
-    return category, products
+    if ctx is not None and ctx.images is not None:
+        products = await ctx.images.process(session, products, ctx)
+    
+    return products
 
-def build_affiliate_link(asin):
-    return f'https://www.amazon.se/dp/{asin}/?tag={ASSOCIATE_TAG}'
+async def crawl_categories(session, seeds, ctx, on_category):
+    """Discover subcategories from the seed departments and run each through process_category
 
-def generate_html(products_by_category, out_path='index.html'):
-    """Generate HTML file (fixed the malformed HTML structure)"""
-    css_styles = """
+    seeds are (name, url) of the departments, processed here too. The tree
+    is walked one level at a time from a bounded frontier: the links of
+    a whole level are collected before the next level is taken, in name
+    order. Which lists are crawled within CRAWL_MAX_PAGES, and the name each
+    gets (after the first parent in that order linking to it), therefore
+    don't depend on how fast pages come back. Lists are processed while the
+    walk goes on and handed to on_category(category, products) when done.
+    Each page whose links are needed is fetched once: its ranking is
+    scanned from the same body, only the other pages of the list are
+    fetched when it is processed.
+    
+    When running one shard, the whole tree is still walked and every page
+    counts towards CRAWL_MAX_PAGES, so each shard arrives at the same lists
+    as an unsharded run; only the shard's own lists are processed. The
+    subcategory links are fetched by every shard, only the lists are split.
+    """
+    frontier = CrawlFrontier(CRAWL_FRONTIER)
+    for name, url in seeds:
+        frontier.push((0, name), url, name)
+    shard = ctx.shard
+    link_slots = asyncio.Semaphore(CRAWL_CONCURRENCY)
+    list_slots = asyncio.Semaphore(CRAWL_CONCURRENCY)
+    
+    async def links(url, owned):
+        async with link_slots:
+            page_links, body = await get_subcategories(session, url, ctx)
+        # Only the entries are kept until the list is processed, not the whole page
+        return page_links, scan_list_page(body, TOP_N, ctx) if owned and body is not None else None
+    
+    async def process(name, url, depth, first_page=None):
+        # Departments are keyed by name in the rank history, as they always were
+        key = list_key(url) if depth > 0 else None
+        async with list_slots:
+            on_category(*await process_category(session, name, url, TOP_N, ctx, key, first_page))
+    
+    processing = set()
+    pages = owned = 0
+    try:
+        while frontier and pages < CRAWL_MAX_PAGES:
+            depth = frontier.peek()[0]
+            level = []
+            while frontier and frontier.peek()[0] == depth and pages < CRAWL_MAX_PAGES:
+                _, url, name = frontier.pop()
+                level.append((name, url))
+                pages += 1
+            mine = [shard is None or shard.owns(shard_key(ctx.market, url)) for _, url in level]
+            owned += sum(mine)
+            if depth >= CRAWL_DEPTH:
+                # No links needed from the last level, its lists are fetched when processed
+                processing.update(asyncio.create_task(process(name, url, depth))
+                                  for (name, url), own in zip(level, mine) if own)
+                break
+            found = await asyncio.gather(*(links(url, own) for (_, url), own in zip(level, mine)))
+            for (name, url), own, (page_links, first_page) in zip(level, mine, found):
+                if own:
+                    processing.add(asyncio.create_task(process(name, url, depth, first_page)))
+                for path, text in page_links:
+                    frontier.push((depth + 1, f'{name} › {text}'), ctx.base_url + path, f'{name} › {text}')
+        if processing:
+            await asyncio.gather(*processing)
+    finally:
+        for task in processing:
+            task.cancel()
+    share = f", {owned} of them in this shard" if shard is not None else ''
+    print(f"[{ctx.market.code}] Crawled {pages} category pages{share}. {frontier.summary()}")
+    return pages
+
+def list_key(url):
+    """Stable identity of a crawled list: its path (and query), whatever it was named after"""
+    parts = urlsplit(url)
+    return parts.path.lstrip('/') + (f'?{parts.query}' if parts.query else '')
+
+def shard_key(market, url):
+    """What a category list is sharded by: its path, the same whatever name or host it is found under"""
+    return f'{market.code}:/{list_key(url)}'
+
+async def first_valid(candidates, limit, lookahead, submit, stats=None):
+    """Return the first `limit` valid results in candidate order, resolving as few as possible
+
+    Keeps limit + lookahead candidates in flight, submits the next one only
+    when an earlier one fails or is filtered out, and cancels whatever is
+    still outstanding once the first `limit` valid results are known.
+    """
+    results = [None] * len(candidates)
+    resolved = [False] * len(candidates)
+    futures = {}
+    submitted = valid = 0
+    try:
+        while True:
+            while submitted < len(candidates) and valid + len(futures) < limit + lookahead:
+                futures[await submit(candidates[submitted])] = submitted
+                submitted += 1
+            
+            # Done once the resolved prefix already holds `limit` valid results
+            count = 0
+            for i in range(submitted):
+                if not resolved[i]:
+                    break
+                if isinstance(results[i], dict):
+                    count += 1
+            if count >= limit or not futures:
+                break
+            
+            done, _ = await asyncio.wait(futures, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                i = futures.pop(future)
+                resolved[i] = True
+                if not future.cancelled() and future.exception() is None:
+                    results[i] = future.result()
+                    if isinstance(results[i], dict):
+                        valid += 1
+    finally:
+        for future in futures:
+            future.cancel()
+        if stats is not None:
+            stats['skipped'] += len(candidates) - submitted
+            stats['cancelled'] += len(futures)
+    
+    return [r for r in results if isinstance(r, dict)][:limit]
+
+async def fetch_product(session, asin, ctx=None):
+    """fetch_product_basic plus bookkeeping: product store, cross-category coalescing"""
+    store = ctx.store if ctx is not None else None
+    journal = ctx.journal if ctx is not None else None
+    
+    async def fetch():
+        replayed = None
+        if journal is not None:
+            # Fetched before the previous run was interrupted; stored again in
+            # case the store's last batch didn't make it to disk
+            replayed = journal.get('product', f'{ctx.market.code}:{asin}')
+        product = replayed or await fetch_product_basic(session, asin, ctx)
+        if product is not None and store is not None:
+            store.upsert(product, ctx.market.code)
+        if product is not None and journal is not None and replayed is None:
+            journal.record('product', f'{ctx.market.code}:{asin}', product)
+        return product
+    
+    # Products ranking in several categories are fetched and parsed once per run
+    if ctx is not None and ctx.coordinator is not None:
+        key = f'{ctx.market.code}:{product_url(asin, ctx.base_url)}'
+        return await ctx.coordinator.get(key, fetch)
+    return await fetch()
+
+async def product_worker(session, ctx):
+    """Consume (asin, future) jobs from the run's product queue"""
+    queue = ctx.product_queue
+    while True:
+        asin, future = await queue.get()
+        try:
+            if future.done():
+                continue  # the category got its quota while this job was queued
+            fetch = asyncio.ensure_future(fetch_product(session, asin, ctx))
+            future.add_done_callback(lambda f, fetch=fetch: fetch.cancel() if f.cancelled() else None)
+            await asyncio.wait({fetch})
+            if future.done():
+                continue
+            if fetch.cancelled():
+                future.cancel()
+            elif fetch.exception() is not None:
+                future.set_exception(fetch.exception())
+            else:
+                future.set_result(fetch.result())
+        finally:
+            queue.task_done()
+
+def build_affiliate_link(asin, market=None):
+    return (market or DEFAULT_MARKETPLACE).affiliate_link(asin)
+
+CSS_STYLES = """
 body {
     font-family: Arial, sans-serif;
     margin: 0;
@@ -227,71 +850,516 @@ header {
 }
 """
 
-    with open(out_path, 'w', encoding='utf-8') as f:
-        f.write(f"""<!DOCTYPE html>
-<html lang="sv">
+# Page templates, assembled once at import; render_category only fills them in
+PAGE_HEAD = """<!DOCTYPE html>
+<html lang="{lang}">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Bästsäljare på Amazon</title>
-    <style>{css_styles}</style>
+    <title>{title}</title>
+    <style>{css}</style>
 </head>
 <body>
     <header>
-        <h1>Bästsäljare på Amazon</h1>
-        <p>Våra populäraste produkter baserat på försäljning. Uppdateras dagligen.</p>
+        <h1>{title}</h1>
+        <p>{intro}</p>
     </header>
-""")
-        
-        for category, products in products_by_category.items():
-            f.write(f"""    <section>
+"""
+PAGE_TAIL = "</body>\n</html>"
+CATEGORY_OPEN = """    <section>
         <div class="category-header">{category}</div>
         <div class="product-scroll-container">
-""")
-            for p in products:
-                img_html = f"<img src='{p['img']}' alt='{p['title']}'>" if p['img'] else ""
-                f.write(f"""            <div class="product-card">
-                <a href="{build_affiliate_link(p['asin'])}" target="_blank">
+"""
+CATEGORY_CLOSE = "        </div>\n    </section>\n"
+PRODUCT_CARD = """            <div class="product-card">
+                <a href="{href}" target="_blank">
                     {img_html}
                     <div class="product-info">
-                        <h3>{p['title']}</h3>
+                        <h3>{title}</h3>
                     </div>
                 </a>
             </div>
-""")
-            f.write("        </div>\n    </section>\n")
-        
-        f.write("</body>\n</html>")
+"""
+PRODUCT_IMG = "<img src='{img}' alt='{title}' width='180' height='150' loading='lazy'>"
+PRODUCT_PICTURE = ("<picture><source type='image/webp' srcset='{webp_srcset}' sizes='180px'>"
+                   "<img src='{src}' srcset='{srcset}' sizes='180px' width='{width}' height='{height}' "
+                   "loading='lazy' alt='{title}'></picture>")
+# Rendered category fragments are only reused while the templates are unchanged
+# (the marketplace and its tag are part of each fragment's key)
+TEMPLATE_HASH = hashlib.sha1(
+    ''.join((CATEGORY_OPEN, CATEGORY_CLOSE, PRODUCT_CARD, PRODUCT_IMG, PRODUCT_PICTURE)).encode('utf-8')
+).hexdigest()
 
-async def main():
-    """Main async function"""
-    session = await create_session()
+def page_head(market):
+    return PAGE_HEAD.format(lang=market.lang, title=market.title, intro=market.intro, css=CSS_STYLES)
+
+# Sharded output: the page is a shell that lists the categories from a manifest
+# shard and fills each one in from its own shard as it scrolls into view
+SHELL_OPEN = """    <style>.product-scroll-container:empty {{ min-height: 220px; }}</style>
+    <main id="categories" data-manifest="{manifest}"></main>
+"""
+SHELL_SCRIPT = """    <script>
+    (function () {
+        var main = document.getElementById('categories');
+        function el(parent, tag, attrs) {
+            var node = document.createElement(tag);
+            for (var name in attrs) node.setAttribute(name, attrs[name]);
+            return parent.appendChild(node);
+        }
+        function card(row, p) {
+            var link = el(el(row, 'div', {'class': 'product-card'}), 'a', {href: p.href, target: '_blank'});
+            var t = p.thumb;
+            if (t) {
+                var picture = el(link, 'picture', {});
+                el(picture, 'source', {type: 'image/webp', srcset: t.webp_srcset, sizes: '180px'});
+                el(picture, 'img', {src: t.src, srcset: t.srcset, sizes: '180px', width: t.width,
+                                    height: t.height, loading: 'lazy', alt: p.title});
+            } else if (p.img) {
+                el(link, 'img', {src: p.img, alt: p.title, width: 180, height: 150, loading: 'lazy'});
+            }
+            el(el(link, 'div', {'class': 'product-info'}), 'h3', {}).textContent = p.title;
+        }
+        var visible = new IntersectionObserver(function (entries) {
+            entries.forEach(function (entry) {
+                if (!entry.isIntersecting) return;
+                visible.unobserve(entry.target);
+                fetch(entry.target.getAttribute('data-src'))
+                    .then(function (response) { return response.json(); })
+                    .then(function (products) {
+                        products.forEach(function (p) { card(entry.target.lastChild, p); });
+                    });
+            });
+        }, {rootMargin: '800px 0px'});
+        fetch(main.getAttribute('data-manifest'))
+            .then(function (response) { return response.json(); })
+            .then(function (categories) {
+                categories.forEach(function (c) {
+                    var section = el(main, 'section', {'data-src': c[1]});
+                    el(section, 'div', {'class': 'category-header'}).textContent = c[0];
+                    el(section, 'div', {'class': 'product-scroll-container'});
+                    visible.observe(section);
+                });
+            });
+    })();
+    </script>
+"""
+
+class HtmlWriter:
+    """Renders index.html incrementally as categories finish
+
+    Each category is rendered as soon as it arrives (reusing the cached
+    fragment when its products are unchanged). close() assembles the page in
+    the given category order, followed by any crawled subcategories sorted by
+    name, and writes it in one go, skipping the write entirely when the file
+    on disk already has the same content.
+
+    With a ShardWriter, categories are written as JSON shards instead and
+    the page is only a shell that loads them, so its size no longer grows
+    with the number of categories or products.
+    """
+
+    def __init__(self, out_path, categories, fragments=None, market=None, metrics=None, shards=None):
+        self.out_path = out_path
+        self.order = list(categories)
+        self.fragments = fragments
+        self.market = market or DEFAULT_MARKETPLACE
+        self.metrics = metrics
+        self.shards = shards  # a ShardWriter for the shell page and per-category JSON output
+        self.rendered = {}  # category -> HTML fragment, or its shard URL
+        self.products = {}  # asin -> product, for the trend sections
+        self.trend_sections = ''
+
+    def add(self, category, products):
+        market = self.market
+        start = time.perf_counter()
+        for p in products:
+            self.products.setdefault(p['asin'], p)
+        if self.shards is not None:
+            self.rendered[category] = self.shards.write(shard_products(products, market))
+        elif self.fragments is None:
+            self.rendered[category] = render_category(category, products, market)
+        else:
+            self.rendered[category] = self.fragments.render(
+                f'{market.code}/{category}', [market.code, market.associate_tag, category, products],
+                lambda: render_category(category, products, market))
+        if self.metrics is not None:
+            self.metrics.observe('render', 'category', time.perf_counter() - start)
+
+    def add_trends(self, trends):
+        """Render the Rising and New this week sections shown above the categories"""
+        sections = ((self.market.rising, trends.rising), (self.market.new_this_week, trends.new))
+        # Trends cover every ranked product, this page only those it could list
+        sections = [(heading, [self.products[asin] for asin, *_ in entries if asin in self.products])
+                    for heading, entries in sections]
+        sections = [(heading, products) for heading, products in sections if products]
+        if self.shards is not None:
+            self.trend_sections = [(heading, self.shards.write(shard_products(products, self.market)))
+                                   for heading, products in sections]
+        else:
+            self.trend_sections = ''.join(render_category(heading, products, self.market)
+                                          for heading, products in sections)
+
+    def close(self):
+        """Write the page; returns False when it was already up to date"""
+        start = time.perf_counter()
+        known = set(self.order)
+        order = self.order + sorted(c for c in self.rendered if c not in known)
+        if self.shards is not None:
+            manifest = list(self.trend_sections) + [[c, self.rendered[c]] for c in order if c in self.rendered]
+            body = SHELL_OPEN.format(manifest=self.shards.write(manifest)) + SHELL_SCRIPT
+            written = write_if_changed(self.out_path, page_head(self.market) + body + PAGE_TAIL)
+        else:
+            body = ''.join(self.rendered[c] for c in order if c in self.rendered)
+            written = write_if_changed(self.out_path,
+                                       page_head(self.market) + self.trend_sections + body + PAGE_TAIL)
+        if self.metrics is not None:
+            self.metrics.observe('render', 'page', time.perf_counter() - start)
+        return written
+
+def render_category(category, products, market=None):
+    parts = [CATEGORY_OPEN.format(category=category)]
+    for p in products:
+        if p.get('thumb'):
+            img_html = PRODUCT_PICTURE.format(title=p['title'], **p['thumb'])
+        elif p['img']:
+            img_html = PRODUCT_IMG.format(img=p['img'], title=p['title'])
+        else:
+            img_html = ""
+        parts.append(PRODUCT_CARD.format(href=build_affiliate_link(p['asin'], market),
+                                         img_html=img_html, title=p['title']))
+    parts.append(CATEGORY_CLOSE)
+    return ''.join(parts)
+
+def shard_products(products, market=None):
+    """What a product card needs, as stored in a category's JSON shard"""
+    cards = []
+    for p in products:
+        card = {'href': build_affiliate_link(p['asin'], market), 'title': p['title']}
+        if p.get('thumb'):
+            card['thumb'] = p['thumb']
+        elif p['img']:
+            card['img'] = p['img']
+        cards.append(card)
+    return cards
+
+def generate_html(products_by_category, out_path='index.html', fragments=None, market=None, metrics=None,
+                  shards=None, trends=None):
+    """Generate HTML file (fixed the malformed HTML structure)"""
+    writer = HtmlWriter(out_path, products_by_category, fragments, market, metrics, shards)
+    for category, products in products_by_category.items():
+        writer.add(category, products)
+    if trends is not None:
+        writer.add_trends(trends)
+    return writer.close()
+
+async def run_marketplace(market, shared, out_dir='.', base_url=None, fragments=None):
+    """Fetch and render one marketplace on its own connection pool and concurrency budget"""
+    base_url = base_url or market.base_url
+    session = await create_session(market, shared.metrics)
+    ctx = shared.for_market(market, base_url,
+                            AdaptiveLimiter(INITIAL_CONCURRENCY, max_limit=MAX_CONCURRENCY),
+                            RequestPolicy(MAX_ATTEMPTS, budget=shared.retry_budget or RETRY_BUDGET,
+                                          hedge=HEDGE_REQUESTS))
     
+    # Category pages feed ASINs into one bounded queue drained by product workers,
+    # and each category is rendered as soon as it completes
+    ctx.product_queue = asyncio.Queue(maxsize=2 * PRODUCT_WORKERS)
+    workers = [asyncio.create_task(product_worker(session, ctx)) for _ in range(PRODUCT_WORKERS)]
+    out_path = os.path.join(out_dir, market.out_file)
+    shards = ShardWriter(os.path.join(out_dir, 'data'), market.code) if OUTPUT_MODE == 'shards' else None
+    writer = HtmlWriter(out_path, market.categories, fragments, market, ctx.metrics, shards)
+    # A shard only collects its categories; the merge step writes the page
+    on_category = writer.add if ctx.shard is None else ctx.shard.collect(market.code)
+    
+    crawl = None
     try:
-        # Process all categories concurrently
-        tasks = [
-            process_category(session, category, url) 
-            for category, url in CATEGORIES.items()
-        ]
-        
-        # Execute all category processing concurrently
-        results = await asyncio.gather(*tasks)
+        seeds = [(category, rebase_url(url, base_url)) for category, url in market.category_urls().items()]
+        tasks = []
+        if CRAWL_DEPTH > 0:
+            # The crawl processes the departments too, from the pages it fetches for their links
+            crawl = asyncio.create_task(crawl_categories(session, seeds, ctx, on_category))
+        else:
+            tasks = [
+                asyncio.create_task(process_category(session, category, url, TOP_N, ctx))
+                for category, url in seeds
+                if ctx.shard is None or ctx.shard.owns(shard_key(market, url))
+            ]
+        for finished in asyncio.as_completed(tasks):
+            on_category(*await finished)
+        if crawl is not None:
+            await crawl
         
-        # Convert results to dictionary
-        products_by_category = dict(results)
+        if ctx.shard is not None:
+            return ctx
+        if ctx.history is not None:
+            trends = compute_trends(ctx.history, f'{market.code}/', TOP_N)
+            writer.add_trends(trends)
+            print(f"[{market.code}] {trends.summary()}")
+        if writer.close():
+            print(f'Wrote {out_path} with top {TOP_N} products per category.')
+        else:
+            print(f'{out_path} is unchanged, not rewritten.')
+        if shards is not None:
+            shards.prune()
+            print(shards.summary())
         
-        # Generate HTML
-        generate_html(products_by_category, 'index.html')
-        print('Wrote index.html with top 12 products per category.')
+    finally:
+        if crawl is not None:
+            crawl.cancel()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await session.close()
+        ctx.close_market()
+    
+    return ctx
+
+async def main(base_url=BASE_URL_OVERRIDE, out_dir='.', markets=None, resume=False, shard=None,
+               shard_path=None, run_id=RUN_ID):
+    """Main async function, returns the run context so callers can read its statistics
+
+    All marketplaces run concurrently in this event loop, sharing the parse
+    pool, caches and product store. With resume, whatever the journal of an
+    interrupted run recorded is reused instead of fetched again.
+    
+    With shard=(i, N) only the categories of shard i are fetched, and
+    instead of writing the pages they are saved to shard_path (by default
+    in SHARD_DIR), tagged with run_id, for merge() to combine.
+    """
+    from parse_pool import ParsePool
+    from image_pipeline import ImagePipeline
+    markets = [MARKETPLACES[code] for code in (markets or MARKETPLACE_CODES)]
+    metrics = RunMetrics()
+    cache = HttpCache(HTTP_CACHE_DIR) if HTTP_CACHE_ENABLED else None
+    store = ProductStore(PRODUCT_STORE_PATH)
+    max_age = STALE_HOURS * 3600 if INCREMENTAL else None
+    parse_pool = ParsePool(PARSE_POOL_KIND, PARSE_WORKERS,
+                           observe=lambda name, cpu: metrics.observe('parse', name, cpu))
+    result = ShardResult(*shard, run_id=run_id) if shard is not None else None
+    if result is not None:
+        # The shard's rankings go into its result file, and the merge step records them
+        history = result
+        journal_path = f'{JOURNAL_PATH}.{result.index}-of-{result.count}'
+        shard_path = shard_path or os.path.join(SHARD_DIR, f'shard-{result.index}-of-{result.count}.json')
+    else:
+        history = RankHistory(HISTORY_DIR) if HISTORY_ENABLED else None
+        journal_path = JOURNAL_PATH
+    ctx = RunContext(cache=cache, store=store, max_age=max_age, parse_pool=parse_pool,
+                     category_only=CATEGORY_ONLY, coordinator=FetchCoordinator(), metrics=metrics,
+                     history=history, shard=result, retry_budget=RetryBudget(RETRY_BUDGET),
+                     # The store commits before each journal batch, so a journaled product is always stored
+                     journal=RunJournal(journal_path, resume, before_flush=store.commit))
+    if IMAGES_ENABLED and result is None:
+        # A shard writes no pages, merge() builds the thumbnails where the pages are written
+        ctx.images = ImagePipeline(os.path.join(out_dir, 'images'), IMAGE_MANIFEST_PATH)
+    fragments = FragmentCache(FRAGMENT_CACHE_PATH, salt=TEMPLATE_HASH)
+    
+    try:
+        await asyncio.gather(*(run_marketplace(market, ctx, out_dir, base_url, fragments)
+                               for market in markets))
+        if result is not None:
+            result.save(shard_path)
+            print(f"{result.summary()} written to {shard_path}")
+        else:
+            if ctx.history is not None:
+                ctx.history.commit()
+            fragments.save()
+            print(fragments.summary())
+        ctx.journal.close(completed=True)
+    finally:
+        ctx.journal.close()
+        metrics.finish()
+        ctx.close()
+        metrics.write(RUN_REPORT_PATH, PROM_TEXTFILE_PATH)
+        print(f"Run report written to {RUN_REPORT_PATH}, Prometheus metrics to {PROM_TEXTFILE_PATH}")
+    
+    return ctx
+
+def render(out_dir='.', markets=None):
+    """Rewrite the pages from the last run's stored rankings and products, without fetching
+
+    The rankings come from the rank history, the products from the product
+    store and the thumbnails from the image manifest. A marketplace with
+    listed products the store doesn't have is not rewritten, as its page
+    would silently lose them. Returns False when there is no recorded run to
+    render or a marketplace was skipped.
+    """
+    history = RankHistory(HISTORY_DIR)
+    timestamp = history.reopen()
+    if timestamp is None:
+        print("Nothing to render: no run in the rank history yet (it needs numpy)")
+        return False
+    store = ProductStore(PRODUCT_STORE_PATH)
+    images = None
+    if IMAGES_ENABLED:
+        from image_pipeline import ImagePipeline
+        images = ImagePipeline(os.path.join(out_dir, 'images'), IMAGE_MANIFEST_PATH)
+    fragments = FragmentCache(FRAGMENT_CACHE_PATH, salt=TEMPLATE_HASH)
+    complete = True
+    
+    for market in [MARKETPLACES[code] for code in (markets or MARKETPLACE_CODES)]:
+        prefix = f'{market.code}/'
+        lists = {}
+        for category, rank, asin in sorted(zip(*(ids.tolist() for ids in history.current(prefix)))):
+            name = history.categories[category]
+            lists.setdefault(history.labels.get(name, name[len(prefix):]), []).append(history.asins[asin])
+        listed = sorted({asin for asins in lists.values() for asin in asins})
+        known = store.get_fresh(listed, None, market.code)
         
+        out_path = os.path.join(out_dir, market.out_file)
+        missing = len(listed) - len(known)
+        if missing:
+            print(f"Not rewriting {out_path}: {missing} of its {len(listed)} products are missing "
+                  f"from the product store, run fetch to rewrite it")
+            complete = False
+            continue
+        shards = ShardWriter(os.path.join(out_dir, 'data'), market.code) if OUTPUT_MODE == 'shards' else None
+        writer = HtmlWriter(out_path, market.categories, fragments, market, shards=shards)
+        for category, asins in lists.items():
+            products = [known[asin] for asin in asins]
+            writer.add(category, images.local(products) if images is not None else products)
+        writer.add_trends(compute_trends(history, prefix, TOP_N, now=timestamp))
+        state = 'Wrote' if writer.close() else 'Unchanged:'
+        print(f"{state} {out_path}, {len(lists)} categories from the run of "
+              f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(timestamp))} UTC")
+        if shards is not None:
+            shards.prune()
+            print(shards.summary())
+    
+    fragments.save()
+    print(fragments.summary())
+    store.close()
+    return complete
+
+async def merge_thumbnails(categories, out_dir):
+    """Merged shard products ({code: {category: products}}) with thumbnails built into out_dir/images
+
+    Downloads are paced by an adaptive limiter and the resizing runs on a
+    parse pool, as during a fetch.
+    """
+    from parse_pool import ParsePool
+    from image_pipeline import ImagePipeline
+    images = ImagePipeline(os.path.join(out_dir, 'images'), IMAGE_MANIFEST_PATH)
+    ctx = RunContext(parse_pool=ParsePool(PARSE_POOL_KIND, PARSE_WORKERS))
+    session = await create_session()
+    try:
+        result = {}
+        for code, lists in categories.items():
+            ctx.market = MARKETPLACES[code]
+            ctx.limiter = AdaptiveLimiter(INITIAL_CONCURRENCY, max_limit=MAX_CONCURRENCY)
+            processed = await asyncio.gather(*(images.process(session, products, ctx) for products in lists.values()))
+            result[code] = dict(zip(lists, processed))
     finally:
         await session.close()
+        ctx.parse_pool.close()
+    images.save()
+    print(images.summary())
+    return result
 
-if __name__ == '__main__':
-    # Install required packages if not already installed:
-    # pip install aiohttp beautifulsoup4
+def merge(paths=None, out_dir='.'):
+    """Combine the result files of a sharded run, record its rankings and write the pages
+
+    paths default to every shard file in SHARD_DIR; all N shards of one run
+    must be there, and the run must have started after the last one in the
+    rank history. The shards crawl the same lists an unsharded run with the
+    same CRAWL_MAX_PAGES would, so the pages list the same categories. The
+    shards build no thumbnails (they may have run on other machines), so
+    they are built here, into out_dir/images. Returns False when the shards
+    can't be merged.
+    """
+    paths = paths or sorted(glob(os.path.join(SHARD_DIR, 'shard-*-of-*.json')))
+    try:
+        merged = merge_shards(paths)
+    except (OSError, ValueError) as e:
+        print(f"Cannot merge: {e}")
+        return False
+    history = RankHistory(HISTORY_DIR) if HISTORY_ENABLED else None
+    if history is not None and len(history.runs) and merged.started <= history.runs[-1]:
+        print(f"Cannot merge: the shards started at {time.strftime('%Y-%m-%d %H:%M', time.gmtime(merged.started))} "
+              f"UTC, not after the last recorded run (already merged, or left over from an older run)")
+        return False
+    if history is not None:
+        for category, ranked in merged.ranks.items():
+            history.add(category, ranked, merged.labels.get(category))
+    if IMAGES_ENABLED:
+        merged.categories = asyncio.run(merge_thumbnails(merged.categories, out_dir))
+    fragments = FragmentCache(FRAGMENT_CACHE_PATH, salt=TEMPLATE_HASH)
+    
+    for code, categories in merged.categories.items():
+        market = MARKETPLACES[code]
+        # The marketplace's own category order first, then the crawled ones, as in an unsharded run
+        products_by_category = {c: categories[c] for c in market.categories if c in categories}
+        products_by_category.update((c, p) for c, p in categories.items() if c not in market.categories)
+        trends = compute_trends(history, f'{code}/', TOP_N, now=merged.started) if history is not None else None
+        out_path = os.path.join(out_dir, market.out_file)
+        shards = ShardWriter(os.path.join(out_dir, 'data'), code) if OUTPUT_MODE == 'shards' else None
+        if generate_html(products_by_category, out_path, fragments, market, shards=shards, trends=trends):
+            print(f"Wrote {out_path} with {len(products_by_category)} categories from {len(paths)} shards")
+        else:
+            print(f'{out_path} is unchanged, not rewritten.')
+        if shards is not None:
+            shards.prune()
+            print(shards.summary())
+    
+    if history is not None:
+        history.commit(merged.started)
+        print(history.summary())
+    fragments.save()
+    print(fragments.summary())
+    return True
+
+def cli(argv=None):
+    """Command line: fetch (the default), render, merge or bench"""
+    parser = argparse.ArgumentParser(description='Fetch Amazon bestseller lists and write the static pages')
+    commands = parser.add_subparsers(dest='command')
+    fetch = commands.add_parser('fetch', help='fetch the bestseller lists and write the pages (the default)')
+    fetch.add_argument('--resume', action='store_true',
+                       help='reuse what an interrupted run journaled instead of fetching it again')
+    fetch.add_argument('--shard', metavar='i/N',
+                       help='fetch only shard i of N (a stable hash of the category list paths) and save it for merge')
+    fetch.add_argument('--shard-file', help=f'where the shard is saved (default: {SHARD_DIR}/shard-i-of-N.json)')
+    fetch.add_argument('--run-id', default=RUN_ID,
+                       help='the same for every shard of one run, checked by merge (default: AMZ_RUN_ID)')
+    render_cmd = commands.add_parser('render', help="rewrite the pages from the last run's stored data, "
+                                                     "without importing the network stack")
+    merge_cmd = commands.add_parser('merge', help='combine the shards of a sharded run and write the pages')
+    merge_cmd.add_argument('files', nargs='*', help=f'shard files (default: all in {SHARD_DIR})')
+    for command in (fetch, render_cmd, merge_cmd):
+        command.add_argument('--out-dir', default='.', help='where the pages are written')
+    for command in (fetch, render_cmd):
+        command.add_argument('--markets', help='comma-separated marketplace codes (default: AMZ_MARKETPLACES)')
+    commands.add_parser('bench', add_help=False,
+                        help='run bench/run_bench.py against the stand-in server; other options are passed on')
+    args, rest = parser.parse_known_args(argv)
+    
+    if args.command == 'bench':
+        # A separate process, as the benchmark sets its AMZ_* variables before importing this module
+        bench = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench', 'run_bench.py')
+        return subprocess.call([sys.executable, bench, *rest])
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    markets = args.markets.split(',') if getattr(args, 'markets', None) else None
+    out_dir = getattr(args, 'out_dir', '.')
+    if args.command == 'render':
+        return 0 if render(out_dir, markets) else 1
+    if args.command == 'merge':
+        return 0 if merge(args.files, out_dir) else 1
+    shard = None
+    if getattr(args, 'shard', None):
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
     
     start_time = time.time()
-    asyncio.run(main())
+    asyncio.run(main(out_dir=out_dir, markets=markets, resume=getattr(args, 'resume', False),
+                     shard=shard, shard_path=getattr(args, 'shard_file', None),
+                     run_id=getattr(args, 'run_id', RUN_ID)))
     end_time = time.time()
     print(f"Execution completed in {end_time - start_time:.2f} seconds")
+    return 0
+
+if __name__ == '__main__':
+    # Install required packages if not already installed:
+    # pip install aiohttp beautifulsoup4
+    sys.exit(cli())
@@ -0,0 +1,55 @@
+import asyncio
+
+
+class FetchCoordinator:
+    """Run-wide single-flight map: one fetch per key, shared by every caller
+
+    Concurrent callers for the same key await the same task, and finished
+    results (including None for failed or filtered products) are memoised
+    for the rest of the run.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.in_flight = {}
+        self.waiters = {}
+        self.fetched = 0
+        self.coalesced = 0  # callers that joined a fetch already in flight
+        self.memo_hits = 0  # callers served from a finished fetch
+
+    async def get(self, key, fetch):
+        """Return the result of fetch() for key, starting it only if nobody has"""
+        if key in self.results:
+            self.memo_hits += 1
+            return self.results[key]
+        task = self.in_flight.get(key)
+        if task is None:
+            self.fetched += 1
+            task = asyncio.ensure_future(fetch())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller giving up doesn't cancel the fetch for the others;
+        # it is only cancelled once every caller waiting on it has given up
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self.waiters.get(key) == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            if key in self.waiters:
+                self.waiters[key] -= 1
+
+    def _finish(self, key, task):
+        del self.in_flight[key]
+        self.waiters.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.results[key] = task.result()
+
+    def summary(self):
+        saved = self.coalesced + self.memo_hits
+        return (f"Fetch coordinator: {self.fetched} product fetches, {saved} requests saved "
+                f"({self.coalesced} coalesced in flight, {self.memo_hits} memoised)")
@@ -0,0 +1,59 @@
+import json
+import hashlib
+from atomic_write import write_atomic
+
+
+class FragmentCache:
+    """Rendered HTML fragments keyed by a hash of their input, kept between runs"""
+
+    def __init__(self, path='.cache/fragments.json', salt=''):
+        self.path = path
+        self.salt = salt  # e.g. a hash of the templates, so template edits invalidate everything
+        self.entries = self._load()
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def key(self, data):
+        blob = json.dumps(data, sort_keys=True, ensure_ascii=False) + self.salt
+        return hashlib.sha1(blob.encode('utf-8')).hexdigest()
+
+    def render(self, name, data, render_fn):
+        """Return render_fn() for this data, reusing the stored fragment when data is unchanged"""
+        key = self.key(data)
+        entry = self.entries.get(name)
+        if entry is not None and entry['key'] == key:
+            self.hits += 1
+            html = entry['html']
+        else:
+            self.misses += 1
+            html = render_fn()
+        self.used[name] = {'key': key, 'html': html}
+        return html
+
+    def save(self):
+        """Persist the fragments used this run, dropping the rest"""
+        write_atomic(self.path, json.dumps(self.used, ensure_ascii=False))
+
+    def summary(self):
+        return f"Fragments: {self.hits} reused, {self.misses} rendered"
+
+
+def write_if_changed(path, content):
+    """Write content to path in one go unless the file already holds exactly that; returns True if written"""
+    data = content.encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            if hashlib.sha256(f.read()).digest() == hashlib.sha256(data).digest():
+                return False
+    except OSError:
+        pass
+    write_atomic(path, data)
+    return True
@@ -0,0 +1,58 @@
+import heapq
+import hashlib
+
+
+class CrawlFrontier:
+    """Bounded, de-duplicated priority queue of pages still to crawl
+
+    Lower priorities come out first; ties keep insertion order. URLs are
+    remembered by an 8-byte digest so each is scheduled at most once per
+    run. Once more than twice `capacity` entries are waiting, all but the
+    best `capacity` are dropped, so memory stays bounded however many links
+    are found.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.heap = []
+        self.seen = set()
+        self.seq = 0
+        self.pushed = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _digest(url):
+        return hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest()
+
+    def push(self, priority, url, item=None):
+        """Schedule url unless it was seen before; returns True if it was added"""
+        digest = self._digest(url)
+        if digest in self.seen:
+            self.duplicates += 1
+            return False
+        self.seen.add(digest)
+        heapq.heappush(self.heap, (priority, self.seq, url, item))
+        self.seq += 1
+        self.pushed += 1
+        if len(self.heap) > 2 * self.capacity:
+            kept = heapq.nsmallest(self.capacity, self.heap)  # sorted, so still a heap
+            self.dropped += len(self.heap) - len(kept)
+            self.heap = kept
+        return True
+
+    def pop(self):
+        """Return (priority, url, item) of the best waiting page"""
+        priority, _, url, item = heapq.heappop(self.heap)
+        return priority, url, item
+
+    def peek(self):
+        """Priority of the best waiting page"""
+        return self.heap[0][0]
+
+    def __len__(self):
+        return len(self.heap)
+
+    def summary(self):
+        return (f"Crawl frontier: {self.pushed} pages scheduled, {self.duplicates} duplicate links, "
+                f"{self.dropped} dropped over capacity, {len(self.heap)} left")
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+from atomic_write import write_atomic
+
+# How long a stored response is served without touching the network, per URL class.
+# After the TTL runs out the entry is revalidated with a conditional request.
+DEFAULT_TTLS = {
+    'category': 60 * 60,          # rankings move, keep this short
+    'product': 3 * 24 * 60 * 60,  # titles and images rarely change
+}
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class HttpCache:
+    """On-disk response cache keyed by URL, with conditional revalidation and LRU eviction"""
+
+    def __init__(self, cache_dir='.cache/http', ttls=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.stats = {'lookup': 0, 'hit': 0, 'revalidated': 0, 'stored': 0, 'evicted': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_dir, key + '.z')
+
+    def _read_body(self, key):
+        try:
+            with open(self._body_path(key), 'rb') as f:
+                return zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+
+    def lookup(self, url, kind):
+        """Return (body, headers) where body is set only for a fresh entry.
+
+        headers holds If-None-Match / If-Modified-Since for a stale entry, so the
+        caller can send a conditional request; both are empty on a cold miss.
+        """
+        self.stats['lookup'] += 1
+        key = self._key(url)
+        entry = self.index.get(key)
+        if entry is None:
+            return None, {}
+
+        entry['last_access'] = time.time()
+        if time.time() - entry['stored_at'] < self.ttls.get(kind, 0):
+            body = self._read_body(key)
+            if body is not None:
+                self.stats['hit'] += 1
+                return body, {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        elif entry.get('date'):
+            headers['If-Modified-Since'] = entry['date']
+        return None, headers
+
+    def revalidated(self, url):
+        """Mark a stale entry fresh after a 304 and return its stored body"""
+        key = self._key(url)
+        entry = self.index.get(key)
+        body = self._read_body(key) if entry else None
+        if body is None:
+            self.index.pop(key, None)
+            return None
+        entry['stored_at'] = entry['last_access'] = time.time()
+        self.stats['revalidated'] += 1
+        return body
+
+    def store(self, url, body, headers):
+        """Store a 200 response body together with its validators"""
+        key = self._key(url)
+        data = zlib.compress(body, 6)
+        try:
+            with open(self._body_path(key), 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Failed to write cache entry for {url}", e)
+            return
+        now = time.time()
+        self.index[key] = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'date': headers.get('Date'),
+            'stored_at': now,
+            'last_access': now,
+            'size': len(data),
+        }
+        self.stats['stored'] += 1
+        self._evict()
+
+    def _evict(self):
+        total = sum(e['size'] for e in self.index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self.index.items(), key=lambda kv: kv[1]['last_access']):
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+            del self.index[key]
+            self.stats['evicted'] += 1
+            total -= entry['size']
+            if total <= self.max_bytes:
+                break
+
+    def save(self):
+        """Persist the index atomically"""
+        write_atomic(self.index_path, json.dumps(self.index))
+
+    def summary(self):
+        s = self.stats
+        misses = s['lookup'] - s['hit'] - s['revalidated']
+        return (f"HTTP cache: {s['hit']} hits, {s['revalidated']} revalidated (304), "
+                f"{misses} misses, {s['stored']} stored, {s['evicted']} evicted")
@@ -0,0 +1,185 @@
+import io
+import os
+import json
+import time
+import asyncio
+import hashlib
+from urllib.parse import urlsplit
+from atomic_write import write_atomic
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are skipped and product images stay hotlinked
+    Image = None
+
+# Product cards show images in a 180x150 box; the second size is for 2x screens
+THUMB_BOX = (180, 150)
+THUMB_SCALES = (1, 2)
+# Thumbnails of images that haven't been listed for this long are deleted
+PRUNE_AFTER = 14 * 24 * 60 * 60
+
+
+def make_thumbnails(data, key, out_dir):
+    """Write WebP and JPEG thumbnails of an image (CPU-bound, runs on the parse pool)
+
+    Returns {'width', 'height', 'jpeg': [(path, w)], 'webp': [(path, w)]} where
+    width/height are the 1x display size, or None if the image can't be decoded.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        return None
+    if image.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+        image = background
+
+    result = {'jpeg': [], 'webp': []}
+    for scale in THUMB_SCALES:
+        thumb = image.copy()
+        thumb.thumbnail((THUMB_BOX[0] * scale, THUMB_BOX[1] * scale), Image.LANCZOS)
+        if scale == 1:
+            result['width'], result['height'] = thumb.size
+        for fmt, ext, options in (('JPEG', 'jpeg', {'quality': 82, 'optimize': True}),
+                                  ('WEBP', 'webp', {'quality': 80, 'method': 4})):
+            name = f'{key}-{thumb.size[0]}.{"jpg" if ext == "jpeg" else ext}'
+            path = os.path.join(out_dir, name)
+            if not os.path.exists(path):
+                buf = io.BytesIO()
+                thumb.save(buf, fmt, **options)
+                write_atomic(path, buf.getvalue())
+            result[ext].append((name, thumb.size[0]))
+    return result
+
+
+class ImagePipeline:
+    """Downloads product images once into a URL-hash keyed cache and serves local thumbnails"""
+
+    def __init__(self, out_dir='images', manifest_path='.cache/images.json', url_prefix='images/'):
+        self.out_dir = out_dir
+        self.manifest_path = manifest_path
+        self.url_prefix = url_prefix
+        os.makedirs(out_dir, exist_ok=True)
+        self.manifest = self._load()
+        self.tasks = {}
+        self.reused = 0
+        self.processed = 0
+        self.failed = 0
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()[:20]
+
+    def _cached(self, key):
+        entry = self.manifest.get(key)
+        if entry is None:
+            return None
+        names = [name for name, _ in entry['jpeg'] + entry['webp']]
+        if not all(os.path.exists(os.path.join(self.out_dir, n)) for n in names):
+            return None
+        return entry
+
+    def thumb_attrs(self, entry):
+        """Markup attributes for a processed image"""
+        def srcset(variants):
+            return ', '.join(f'{self.url_prefix}{name} {w}w' for name, w in variants)
+        return {
+            'src': self.url_prefix + entry['jpeg'][0][0],
+            'srcset': srcset(entry['jpeg']),
+            'webp_srcset': srcset(entry['webp']),
+            'width': entry['width'],
+            'height': entry['height'],
+        }
+
+    async def process(self, session, products, ctx=None):
+        """Return products with a 'thumb' entry for every image that could be processed"""
+        if Image is None:
+            return products
+        entries = await asyncio.gather(*(self._entry(session, p.get('img'), ctx) for p in products))
+        return [dict(p, thumb=self.thumb_attrs(e)) if e else p for p, e in zip(products, entries)]
+
+    def local(self, products):
+        """Like process, but only with thumbnails that are already on disk, downloading nothing"""
+        if Image is None:
+            return products
+        entries = [self._cached(self.key(p['img'])) if p.get('img') else None for p in products]
+        return [dict(p, thumb=self.thumb_attrs(e)) if e else p for p, e in zip(products, entries)]
+
+    async def _entry(self, session, url, ctx):
+        if not url:
+            return None
+        key = self.key(url)
+        # One download and resize per image per run, even if several categories list it
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.ensure_future(self._build(session, url, key, ctx))
+        return await asyncio.shield(self.tasks[key])
+
+    async def _build(self, session, url, key, ctx):
+        entry = self._cached(key)
+        if entry is not None:
+            entry['last_used'] = time.time()
+            self.reused += 1
+            return entry
+        data = await self._download(session, url, ctx)
+        if data is None:
+            self.failed += 1
+            return None
+        if ctx is not None:
+            entry = await ctx.parse(make_thumbnails, data, key, self.out_dir)
+        else:
+            entry = make_thumbnails(data, key, self.out_dir)
+        if entry is None:
+            self.failed += 1
+            return None
+        entry['last_used'] = time.time()
+        self.manifest[key] = entry
+        self.processed += 1
+        return entry
+
+    async def _download(self, session, url, ctx):
+        limiter = ctx.limiter if ctx is not None else None
+        host = urlsplit(url).netloc
+        if limiter is not None:
+            await limiter.acquire(host)
+        outcome = 'neutral'
+        try:
+            async with session.get(url, trace_request_ctx={'kind': 'image'}) as response:
+                if response.status != 200:
+                    print(f"Failed to fetch image: {url}, status: {response.status}")
+                    return None
+                data = await response.read()
+                outcome = 'ok'
+                return data
+        except Exception as e:
+            print(f"Failed to fetch image: {url}", e)
+            outcome = 'throttled'
+            return None
+        finally:
+            if limiter is not None:
+                limiter.release(host, outcome)
+
+    def save(self):
+        """Persist the manifest, deleting thumbnails that haven't been listed for a while"""
+        cutoff = time.time() - PRUNE_AFTER
+        for key in [k for k, e in self.manifest.items() if e.get('last_used', 0) < cutoff]:
+            entry = self.manifest.pop(key)
+            for name, _ in entry['jpeg'] + entry['webp']:
+                try:
+                    os.remove(os.path.join(self.out_dir, name))
+                except OSError:
+                    pass
+        write_atomic(self.manifest_path, json.dumps(self.manifest))
+
+    def summary(self):
+        if Image is None:
+            return "Images: Pillow not installed, product images are hotlinked"
+        return (f"Images: {self.processed} new, {self.reused} already processed, "
+                f"{self.failed} failed")
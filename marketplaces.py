@@ -0,0 +1,106 @@
+import os
+
+
+class Marketplace:
+    """Everything that differs between Amazon storefronts: host, tag, categories, language"""
+
+    def __init__(self, code, base_url, associate_tag, categories, out_file,
+                 lang, accept_language, title, intro, rising='Rising', new_this_week='New this week'):
+        self.code = code
+        self.base_url = base_url
+        self.associate_tag = associate_tag
+        self.categories = categories  # display name -> bestseller path
+        self.out_file = out_file
+        self.lang = lang
+        self.accept_language = accept_language
+        self.title = title
+        self.intro = intro
+        self.rising = rising  # headings of the trend sections above the categories
+        self.new_this_week = new_this_week
+
+    def category_urls(self):
+        return {name: self.base_url + path for name, path in self.categories.items()}
+
+    def affiliate_link(self, asin):
+        if not self.associate_tag:
+            return f'{self.base_url}/dp/{asin}/'
+        return f'{self.base_url}/dp/{asin}/?tag={self.associate_tag}'
+
+
+MARKETPLACES = {
+    'se': Marketplace(
+        'se', 'https://www.amazon.se', os.environ.get('AMZ_ASSOC_TAG_SE', 'amzing2025-21'),
+        {
+            "Beauty & Personal Care": "/gp/bestsellers/beauty",
+            "Home & Kitchen": "/gp/bestsellers/kitchen",
+            "Clothing, Shoes & Jewelry": "/gp/bestsellers/fashion",
+            "Electronics": "/gp/bestsellers/electronics",
+            "Toys & Games": "/gp/bestsellers/toys",
+            "Books": "/gp/bestsellers/books",
+            "Sports & Outdoors": "/gp/bestsellers/sports",
+            "Health & Household": "/gp/bestsellers/health",
+            "Tools & Home Improvement": "/gp/bestsellers/industrial",
+            "Pet Supplies": "/gp/bestsellers/pet-supplies",
+        },
+        'index.html', 'sv', 'sv-SE,sv;q=0.9,en;q=0.8',
+        'Bästsäljare på Amazon',
+        'Våra populäraste produkter baserat på försäljning. Uppdateras dagligen.',
+        'Stiger', 'Nytt denna vecka',
+    ),
+    'de': Marketplace(
+        'de', 'https://www.amazon.de', os.environ.get('AMZ_ASSOC_TAG_DE', ''),
+        {
+            "Beauty": "/gp/bestsellers/beauty",
+            "Küche, Haushalt & Wohnen": "/gp/bestsellers/kitchen",
+            "Fashion": "/gp/bestsellers/fashion",
+            "Elektronik & Foto": "/gp/bestsellers/ce-de",
+            "Spielzeug": "/gp/bestsellers/toys",
+            "Bücher": "/gp/bestsellers/books",
+            "Sport & Freizeit": "/gp/bestsellers/sports",
+            "Drogerie & Körperpflege": "/gp/bestsellers/drugstore",
+            "Baumarkt": "/gp/bestsellers/diy",
+            "Haustier": "/gp/bestsellers/pet-supplies",
+        },
+        'index-de.html', 'de', 'de-DE,de;q=0.9,en;q=0.8',
+        'Bestseller bei Amazon',
+        'Unsere beliebtesten Produkte nach Verkaufszahlen. Täglich aktualisiert.',
+        'Aufsteiger', 'Neu diese Woche',
+    ),
+    'uk': Marketplace(
+        'uk', 'https://www.amazon.co.uk', os.environ.get('AMZ_ASSOC_TAG_UK', ''),
+        {
+            "Beauty": "/gp/bestsellers/beauty",
+            "Home & Kitchen": "/gp/bestsellers/kitchen",
+            "Fashion": "/gp/bestsellers/fashion",
+            "Electronics & Photo": "/gp/bestsellers/electronics",
+            "Toys & Games": "/gp/bestsellers/kids",
+            "Books": "/gp/bestsellers/books",
+            "Sports & Outdoors": "/gp/bestsellers/sports",
+            "Health & Personal Care": "/gp/bestsellers/drugstore",
+            "DIY & Tools": "/gp/bestsellers/diy",
+            "Pet Supplies": "/gp/bestsellers/pet-supplies",
+        },
+        'index-uk.html', 'en-GB', 'en-GB,en;q=0.9',
+        'Amazon Bestsellers',
+        'Our most popular products based on sales. Updated daily.',
+    ),
+    'fr': Marketplace(
+        'fr', 'https://www.amazon.fr', os.environ.get('AMZ_ASSOC_TAG_FR', ''),
+        {
+            "Beauté et Parfum": "/gp/bestsellers/beauty",
+            "Cuisine et Maison": "/gp/bestsellers/kitchen",
+            "Mode": "/gp/bestsellers/fashion",
+            "High-Tech": "/gp/bestsellers/electronics",
+            "Jeux et Jouets": "/gp/bestsellers/toys",
+            "Livres": "/gp/bestsellers/books",
+            "Sports et Loisirs": "/gp/bestsellers/sports",
+            "Hygiène et Santé": "/gp/bestsellers/hpc",
+            "Bricolage": "/gp/bestsellers/diy",
+            "Animalerie": "/gp/bestsellers/pet-supplies",
+        },
+        'index-fr.html', 'fr', 'fr-FR,fr;q=0.9,en;q=0.8',
+        'Meilleures ventes Amazon',
+        'Nos produits les plus populaires selon les ventes. Mis à jour quotidiennement.',
+        'En hausse', 'Nouveautés de la semaine',
+    ),
+}
@@ -0,0 +1,57 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+def _timed_call(fn, *args):
+    """Run fn in the worker and report the CPU time it used"""
+    start = time.thread_time()
+    result = fn(*args)
+    return result, time.thread_time() - start
+
+
+class ParsePool:
+    """One long-lived executor per run that all HTML parsing is submitted to"""
+
+    def __init__(self, kind=None, workers=None, observe=None):
+        cores = os.cpu_count() or 1
+        self.kind = kind or ('process' if cores > 1 else 'thread')
+        self.workers = workers or cores
+        if self.kind == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        elif self.kind == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        else:
+            raise ValueError(f"Unknown parse pool kind: {self.kind}")
+        self.queued = 0
+        self.max_queue_depth = 0
+        self.parses = 0
+        self.cpu_time = 0.0
+        self.max_cpu_time = 0.0
+        self.observe = observe  # called with (function name, CPU seconds) after each parse
+
+    async def run(self, fn, *args):
+        """Submit fn(*args) to the pool and await its result"""
+        loop = asyncio.get_running_loop()
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        try:
+            result, cpu = await loop.run_in_executor(self.executor, _timed_call, fn, *args)
+        finally:
+            self.queued -= 1
+        self.parses += 1
+        self.cpu_time += cpu
+        self.max_cpu_time = max(self.max_cpu_time, cpu)
+        if self.observe is not None:
+            self.observe(fn.__name__, cpu)
+        return result
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def summary(self):
+        mean = self.cpu_time / self.parses * 1000 if self.parses else 0.0
+        return (f"Parse pool ({self.kind} x{self.workers}): {self.parses} parses, "
+                f"{self.cpu_time:.2f}s CPU, {mean:.1f}ms mean / {self.max_cpu_time * 1000:.1f}ms max "
+                f"per parse, max queue depth {self.max_queue_depth}")
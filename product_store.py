@@ -0,0 +1,75 @@
+import os
+import time
+import sqlite3
+
+# Upserts are committed in batches, so a crash loses at most the last batch
+COMMIT_EVERY = 50
+COMMIT_SECONDS = 5.0
+
+
+class ProductStore:
+    """Persistent product details keyed by marketplace and ASIN, used for incremental refreshes"""
+
+    def __init__(self, path='.cache/products.sqlite'):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        # Stores from before marketplaces were keyed by ASIN alone; they are only a cache
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(products)")]
+        if columns and 'market' not in columns:
+            self.conn.execute("DROP TABLE products")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                market TEXT NOT NULL,
+                asin TEXT NOT NULL,
+                title TEXT NOT NULL,
+                img TEXT,
+                url TEXT NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (market, asin)
+            )
+        """)
+        self.reused = 0
+        self.updated = 0
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+
+    def get_fresh(self, asins, max_age, market='se'):
+        """Return {asin: product} for the given ASINs seen within max_age seconds (None: any age)"""
+        if not asins:
+            return {}
+        cutoff = time.time() - max_age if max_age is not None else 0
+        placeholders = ','.join('?' * len(asins))
+        rows = self.conn.execute(
+            f"SELECT asin, title, img, url FROM products "
+            f"WHERE market = ? AND last_seen >= ? AND asin IN ({placeholders})",
+            [market, cutoff, *asins],
+        ).fetchall()
+        self.reused += len(rows)
+        return {
+            asin: {'asin': asin, 'title': title, 'img': img, 'url': url}
+            for asin, title, img, url in rows
+        }
+
+    def upsert(self, product, market='se'):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO products (market, asin, title, img, url, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (market, product['asin'], product['title'], product['img'], product['url'], time.time()),
+        )
+        self.updated += 1
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY or time.monotonic() - self.last_commit >= COMMIT_SECONDS:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def summary(self):
+        return f"Product store: {self.reused} reused, {self.updated} fetched and updated"
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+from atomic_write import write_atomic
+
+try:
+    import numpy as np
+except ImportError:  # rankings are simply not kept
+    np = None
+
+# One row per listed product per run, each field in its own append-only file
+COLUMNS = {'run': 'uint32', 'category': 'uint16', 'rank': 'uint8', 'asin': 'uint32'}
+DAY = 24 * 60 * 60
+
+
+class RankHistory:
+    """Append-only columnar history of every run's rankings
+
+    Rows (run, category, rank, asin) are appended to one raw file per
+    column, 11 bytes per listed product. Runs, categories and ASINs are
+    interned: runs.i8 holds each run's timestamp, categories.json and
+    asins.txt map ids to names, and labels.json holds the display names of
+    categories keyed by something else (crawled lists, by path). A run's rows only count once its timestamp
+    has been appended, so a crash mid-write leaves the previous runs intact.
+    Queries are vectorised over the whole history held in memory.
+    """
+
+    def __init__(self, path='.cache/history'):
+        self.path = path
+        self.pending = []  # (category id, rank, asin id) of the run being recorded
+        self.runs = []
+        if np is None:
+            return
+        os.makedirs(path, exist_ok=True)
+        self.runs = self._read('runs.i8', 'int64')
+        self.categories = self._load_json('categories.json', [])
+        self.category_ids = {name: i for i, name in enumerate(self.categories)}
+        self.labels = self._load_json('labels.json', {})
+        self.asins = self._load_lines('asins.txt')
+        self.asin_ids = {asin: i for i, asin in enumerate(self.asins)}
+        self.saved_asins = len(self.asins)
+        self.columns = {name: self._read(name + '.col', dtype) for name, dtype in COLUMNS.items()}
+        self._repair()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read(self, name, dtype):
+        try:
+            return np.fromfile(self._file(name), dtype=dtype)
+        except (OSError, ValueError):
+            return np.zeros(0, dtype=dtype)
+
+    def _load_json(self, name, default):
+        try:
+            with open(self._file(name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def _load_lines(self, name):
+        try:
+            with open(self._file(name), 'r+b') as f:
+                data = f.read()
+                if not data.endswith(b'\n'):
+                    f.truncate(data.rfind(b'\n') + 1)  # a line cut short by a crash
+        except OSError:
+            return []
+        return data.decode('utf-8').split('\n')[:-1]
+
+    def _repair(self):
+        """Drop rows of a run that never got its timestamp, and any half-written row"""
+        rows = min(len(column) for column in self.columns.values())
+        run = self.columns['run'][:rows]
+        rows = int(np.searchsorted(run, len(self.runs)))
+        for name, column in self.columns.items():
+            if len(column) != rows:
+                self.columns[name] = column[:rows]
+                with open(self._file(name + '.col'), 'r+b') as f:
+                    f.truncate(rows * column.itemsize)
+
+    def _intern(self, names, ids, name, column):
+        if name not in ids:
+            if len(names) > np.iinfo(COLUMNS[column]).max:
+                # astype() would silently wrap the id onto another category or ASIN
+                raise ValueError(f"rank history holds the maximum of {len(names)} {column} ids, "
+                                 f"the {column} column must be widened")
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    def add(self, category, ranked, label=None):
+        """Queue one category's [(rank, asin)] for the run being recorded, with its display name"""
+        if np is None:
+            return
+        if label is not None:
+            self.labels[category] = label
+        category_id = self._intern(self.categories, self.category_ids, category, 'category')
+        self.pending.extend((category_id, min(rank, 255), self._intern(self.asins, self.asin_ids, asin, 'asin'))
+                            for rank, asin in ranked)
+
+    def current(self, prefix=''):
+        """(category ids, ranks, asin ids) of the queued rows whose category starts with prefix"""
+        pending = np.array(self.pending, dtype='int64').reshape(-1, 3)
+        if prefix:
+            wanted = [i for i, name in enumerate(self.categories) if name.startswith(prefix)]
+            pending = pending[np.isin(pending[:, 0], wanted)]
+        return pending[:, 0], pending[:, 1], pending[:, 2]
+
+    def commit(self, timestamp=None):
+        """Append the queued rankings as a new run; returns its run id"""
+        if np is None or not self.pending:
+            self.pending = []
+            return None
+        timestamp = int(timestamp if timestamp is not None else time.time())
+        run_id = len(self.runs)
+        pending = np.array(self.pending, dtype='int64').reshape(-1, 3)
+        rows = {
+            'run': np.full(len(pending), run_id, dtype=COLUMNS['run']),
+            'category': pending[:, 0].astype(COLUMNS['category']),
+            'rank': pending[:, 1].astype(COLUMNS['rank']),
+            'asin': pending[:, 2].astype(COLUMNS['asin']),
+        }
+        self.pending = []
+
+        # Dictionaries first, then the rows, and the run's timestamp last
+        if len(self.asins) > self.saved_asins:
+            with open(self._file('asins.txt'), 'a', encoding='utf-8') as f:
+                f.write(''.join(asin + '\n' for asin in self.asins[self.saved_asins:]))
+            self.saved_asins = len(self.asins)
+        for name, data in (('categories.json', self.categories), ('labels.json', self.labels)):
+            write_atomic(self._file(name), json.dumps(data, ensure_ascii=False))
+        for name, values in rows.items():
+            with open(self._file(name + '.col'), 'ab') as f:
+                values.tofile(f)
+            self.columns[name] = np.concatenate((self.columns[name], values))
+        with open(self._file('runs.i8'), 'ab') as f:
+            np.array([timestamp], dtype='int64').tofile(f)
+        self.runs = np.append(self.runs, np.int64(timestamp))
+        return run_id
+
+    def reopen(self):
+        """Take the latest run back into pending, in memory only, to render it again
+
+        Returns its timestamp, or None when there is no run. The files are
+        left alone; committing afterwards would record the run twice.
+        """
+        if np is None or not len(self.runs):
+            return None
+        last = self.rows(-1)
+        c = self.columns
+        self.pending = list(zip(c['category'][last].tolist(), c['rank'][last].tolist(), c['asin'][last].tolist()))
+        for name in c:
+            c[name] = c[name][:last.start]
+        timestamp = int(self.runs[-1])
+        self.runs = self.runs[:-1]
+        return timestamp
+
+    def rows(self, first_run, last_run=None):
+        """Slice of the rows of runs first_run..last_run (default: to the latest)
+
+        Runs are appended in order, so the run column is sorted and this is
+        two binary searches. Negative run ids count from the latest run.
+        """
+        if first_run < 0:
+            first_run += len(self.runs)
+        if last_run is None:
+            last_run = len(self.runs) - 1
+        elif last_run < 0:
+            last_run += len(self.runs)
+        run = self.columns['run']
+        lo, hi = np.searchsorted(run, np.array([first_run, last_run + 1], dtype=run.dtype))
+        return slice(int(lo), int(hi))
+
+    def _category_mask(self, category, column):
+        if category is None:
+            return True
+        return column == self.category_ids.get(category, -1)
+
+    def asin_history(self, asin, category=None):
+        """[(timestamp, category, rank)] of every run that listed the ASIN, oldest first"""
+        asin_id = self.asin_ids.get(asin)
+        if np is None or asin_id is None:
+            return []
+        c = self.columns
+        mask = (c['asin'] == asin_id) & self._category_mask(category, c['category'])
+        runs, categories, ranks = c['run'][mask], c['category'][mask], c['rank'][mask]
+        return list(zip(self.runs[runs].tolist(), [self.categories[i] for i in categories], ranks.tolist()))
+
+    def days_in_top(self, asin, n=10, category=None):
+        """Number of distinct (UTC) days the ASIN ranked n or better"""
+        asin_id = self.asin_ids.get(asin)
+        if np is None or asin_id is None:
+            return 0
+        c = self.columns
+        mask = (c['asin'] == asin_id) & (c['rank'] <= n) & self._category_mask(category, c['category'])
+        return int(np.unique(self.runs[c['run'][mask]] // DAY).size)
+
+    def movers(self, run_from=-2, run_to=-1, limit=10, category=None):
+        """Biggest rank changes between two runs (ids, negative counts from the latest)
+
+        Only ASINs listed in the same category in both runs count. Returns
+        dicts sorted by the size of the change; a positive change means the
+        product moved up.
+        """
+        if np is None or len(self.runs) < 2:
+            return []
+        c = self.columns
+        a, b = self.rows(run_from, run_from), self.rows(run_to, run_to)
+        # (category, asin) packed into one int64 key per row, joined with intersect1d
+        key_a = (c['category'][a].astype('int64') << 32) | c['asin'][a]
+        key_b = (c['category'][b].astype('int64') << 32) | c['asin'][b]
+        keys, ia, ib = np.intersect1d(key_a, key_b, return_indices=True)
+        if category is not None:
+            keep = (keys >> 32) == self.category_ids.get(category, -1)
+            keys, ia, ib = keys[keep], ia[keep], ib[keep]
+        rank_a = c['rank'][a][ia].astype('int32')
+        rank_b = c['rank'][b][ib].astype('int32')
+        change = rank_a - rank_b
+        order = np.argsort(-np.abs(change), kind='stable')[:limit]
+        return [
+            {'asin': self.asins[int(keys[i] & 0xFFFFFFFF)], 'category': self.categories[int(keys[i] >> 32)],
+             'rank_from': int(rank_a[i]), 'rank_to': int(rank_b[i]), 'change': int(change[i])}
+            for i in order
+        ]
+
+    def summary(self):
+        if np is None:
+            return "Rank history: numpy not installed, rankings are not kept"
+        size = sum(column.nbytes for column in self.columns.values()) + self.runs.nbytes
+        return (f"Rank history: {len(self.runs)} runs, {len(self.columns['run'])} rows, "
+                f"{len(self.asins)} ASINs, {size / 1024:.1f} KB of columns")
@@ -0,0 +1,98 @@
+import time
+
+from rank_history import np, DAY
+
+WEEK = 7 * DAY
+# Runs looked back on for the trend score, and how fast older moves stop counting
+TREND_RUNS = 14
+TREND_HALF_LIFE_DAYS = 3.0
+# Rank given to products that weren't listed in a run (lists stop at 100)
+UNRANKED = 101
+
+
+class Trends:
+    """Rank analytics of the current run against the stored history
+
+    rising and new are [(asin, category, rank, change, score)] of current
+    products, best first and one entry per ASIN; dropouts are
+    [(asin, category, previous rank)] listed last run but not now.
+    """
+
+    def __init__(self, rising=(), new=(), dropouts=(), entries=0):
+        self.rising = list(rising)
+        self.new = list(new)
+        self.dropouts = list(dropouts)
+        self.entries = entries  # current products that weren't listed in the previous run
+
+    def summary(self):
+        return (f"Trends: {len(self.rising)} rising, {len(self.new)} new this week, "
+                f"{self.entries} entered and {len(self.dropouts)} dropped out since the last run")
+
+
+def compute_trends(history, prefix='', limit=12, now=None):
+    """Compare the rankings queued on history (not yet committed) with its stored runs
+
+    Everything is computed on arrays, one row per current (category, ASIN):
+    a rank matrix over the last TREND_RUNS runs, the rank change since the
+    previous run, a trend score (places climbed between consecutive runs
+    while listed in both, weighted down by age with a TREND_HALF_LIFE_DAYS half-life), and each
+    ASIN's first listed run to find the ones that are new this week.
+    """
+    if np is None or history is None or not len(history.runs):
+        return Trends()
+    category, rank, asin = history.current(prefix)
+    if not len(asin):
+        return Trends()
+    now = now if now is not None else time.time()
+    runs = history.runs
+    c = history.columns
+    keys = (category << 32) | asin
+
+    # Rank of each current (category, ASIN) in each recent run, UNRANKED where not listed
+    first = max(0, len(runs) - TREND_RUNS)
+    window = history.rows(first)
+    window_keys = (c['category'][window].astype('int64') << 32) | c['asin'][window]
+    sorter = np.argsort(keys)
+    pos = sorter[np.minimum(np.searchsorted(keys[sorter], window_keys), len(keys) - 1)]
+    hit = keys[pos] == window_keys
+    ranks = np.full((len(keys), len(runs) - first + 1), UNRANKED, dtype='int32')
+    ranks[pos[hit], c['run'][window][hit].astype('int64') - first] = c['rank'][window][hit]
+    ranks[:, -1] = rank
+
+    climbed = ranks[:, :-1] - ranks[:, 1:]
+    change = climbed[:, -1]
+    # Only the top N is stored, so entering or leaving it says nothing about
+    # how far a product moved; those steps don't count towards the score
+    climbed = np.where((ranks[:, :-1] == UNRANKED) | (ranks[:, 1:] == UNRANKED), 0, climbed)
+    times = np.append(runs[first:], now)
+    weights = 0.5 ** ((now - times[1:]) / DAY / TREND_HALF_LIFE_DAYS)
+    score = climbed @ weights
+    entered = ranks[:, -2] == UNRANKED
+
+    # ASIN ids are interned in order of first listing, so the highest id listed
+    # by the end of each run tells in which run any ASIN first appeared
+    starts = np.searchsorted(c['run'], np.arange(len(runs), dtype=c['run'].dtype))
+    seen = np.maximum.accumulate(np.maximum.reduceat(c['asin'], starts).astype('int64'))
+    first_listed = np.append(runs, now)[np.searchsorted(seen, asin)]
+    new = (first_listed >= now - WEEK) & (runs[0] < now - WEEK)
+
+    # Listed last run in one of these categories, but not anymore
+    last = history.rows(-1)
+    last_category = c['category'][last].astype('int64')
+    last_keys = (last_category << 32) | c['asin'][last]
+    gone = np.isin(last_category, np.unique(category)) & ~np.isin(last_keys, keys)
+
+    def entries(order):
+        # One entry per ASIN, keeping its best-placed category
+        _, unique = np.unique(asin[order], return_index=True)
+        order = order[np.sort(unique)][:limit]
+        return [(history.asins[asin[i]], history.categories[category[i]], int(rank[i]),
+                 int(change[i]), float(score[i])) for i in order]
+
+    rising = np.flatnonzero((score > 0) & ~entered)  # entries are counted in entered, not rising
+    rising = rising[np.lexsort((rank[rising], -score[rising]))]
+    new = np.flatnonzero(new)
+    new = new[np.lexsort((-score[new], rank[new]))]
+    dropouts = [(history.asins[a], history.categories[k], int(r))
+                for k, r, a in zip(last_category[gone], c['rank'][last][gone], c['asin'][last][gone])]
+    return Trends(entries(rising), entries(new), dropouts, int(entered.sum()))
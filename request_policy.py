@@ -0,0 +1,147 @@
+import random
+import asyncio
+from collections import deque
+
+
+class RetryBudget:
+    """Extra attempts (retries and hedges) allowed per run, shared by every policy of the run"""
+
+    def __init__(self, total=60):
+        self.total = total
+        self.left = total
+        self.exhausted = 0  # attempts refused once it ran out
+
+    def take(self):
+        if self.left <= 0:
+            self.exhausted += 1
+            return False
+        self.left -= 1
+        return True
+
+    def summary(self):
+        return (f"Retry budget: {self.total - self.left} of {self.total} used, "
+                f"exhausted {self.exhausted} times")
+
+
+class RequestPolicy:
+    """Bounded retries with backoff and jitter, a per-run retry budget and hedged requests
+
+    An attempt is a coroutine function taking a `started` callback, which it
+    calls once the request actually goes out (after any queueing), and
+    returning a result; should_retry(result) decides whether a failed result
+    is worth another try. With hedging on, a second attempt is started once
+    the first has been on the wire longer than the observed p95 latency, and
+    whichever finishes first with a good result wins. budget is a
+    RetryBudget, shared when the run has several policies (one per
+    marketplace), or a number of extra attempts for this policy alone.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, budget=60,
+                 hedge=False, hedge_min_samples=20, seed=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget if isinstance(budget, RetryBudget) else RetryBudget(budget)
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.rng = random.Random(seed)
+        self.latencies = deque(maxlen=200)
+        self._p95 = None
+        self.stats = {'retries': 0, 'hedges': 0, 'hedge_wins': 0}
+
+    def _take_budget(self):
+        return self.budget.take()
+
+    def backoff(self, retry):
+        """Full-jitter exponential backoff before the given retry (1-based)"""
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+    def observe(self, latency):
+        self.latencies.append(latency)
+        if len(self.latencies) % 10 == 0:
+            ordered = sorted(self.latencies)
+            self._p95 = ordered[int(0.95 * (len(ordered) - 1))]
+
+    def hedge_delay(self):
+        if len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self._p95
+
+    async def run(self, attempt, should_retry):
+        retry = 0
+        while True:
+            result = await self._hedged(attempt, should_retry)
+            if not should_retry(result) or retry + 1 >= self.max_attempts or not self._take_budget():
+                return result
+            retry += 1
+            self.stats['retries'] += 1
+            await asyncio.sleep(self.backoff(retry))
+
+    async def _hedged(self, attempt, should_retry):
+        if not self.hedge:
+            result, latency = await self._timed(attempt)
+        else:
+            start = _Start()
+            first = asyncio.ensure_future(self._timed(attempt, start))
+            try:
+                # The hedge clock only runs once the first attempt is on the wire
+                started = asyncio.ensure_future(start.event.wait())
+                await asyncio.wait({first, started}, return_when=asyncio.FIRST_COMPLETED)
+                started.cancel()
+                delay = self.hedge_delay()
+                done = {first}
+                if delay is not None:
+                    done, _ = await asyncio.wait({first}, timeout=delay)
+            except asyncio.CancelledError:
+                first.cancel()
+                raise
+            if not done and self._take_budget():
+                self.stats['hedges'] += 1
+                second = asyncio.ensure_future(self._timed(attempt))
+                return await self._first_good(first, second, should_retry)
+            result, latency = await first
+        if latency is not None and not should_retry(result):
+            self.observe(latency)
+        return result
+
+    async def _timed(self, attempt, start=None):
+        start = start or _Start()
+        result = await attempt(start)
+        latency = asyncio.get_running_loop().time() - start.at if start.at is not None else None
+        return result, latency
+
+    async def _first_good(self, first, second, should_retry):
+        pending = {first, second}
+        result = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result, latency = task.result()
+                    if not should_retry(result):
+                        if latency is not None:
+                            self.observe(latency)
+                        if task is second:
+                            self.stats['hedge_wins'] += 1
+                        return result
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def summary(self):
+        s = self.stats
+        return (f"Request policy: {s['retries']} retries, {s['hedges']} hedged "
+                f"({s['hedge_wins']} won)")
+
+
+class _Start:
+    """Callback an attempt calls when its request goes out"""
+
+    def __init__(self):
+        self.at = None
+        self.event = asyncio.Event()
+
+    def __call__(self):
+        self.at = asyncio.get_running_loop().time()
+        self.event.set()
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+
+# Records are written and fsynced in batches of this many, or once this many seconds have passed
+JOURNAL_BATCH = 200
+JOURNAL_FLUSH_SECONDS = 1.0
+# A journal left by a run older than this is not resumed, its rankings are stale
+JOURNAL_MAX_AGE = 12 * 60 * 60
+
+
+class RunJournal:
+    """Append-only journal of the fetches a run has completed, so a killed run can resume
+
+    Each line is one JSON record [kind, key, value]: a category list's ranked
+    ASINs, a page's subcategory links or a parsed product. Records are
+    buffered and written with one write and fsync per batch, so an
+    interrupted run loses at most the last batch. before_flush is called
+    ahead of each batch, so state the records depend on (the product store)
+    can be made durable first. On resume the journal is replayed (a line cut
+    short by the crash is dropped) and get() answers from it instead of the
+    network. A run that completes deletes it.
+    """
+
+    def __init__(self, path='.cache/journal.jsonl', resume=False, before_flush=None):
+        self.path = path
+        self.before_flush = before_flush
+        self.entries = {}
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        self.replayed = 0
+        self.hits = 0
+        self.recorded = 0
+        self.flushes = 0
+        self.stale = False
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume:
+            self._replay()
+        if not self.entries:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(['run', '', int(time.time())]) + '\n')
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        good = 0
+        entries = {}
+        for line in data.split(b'\n')[:-1]:
+            try:
+                kind, key, value = json.loads(line)
+            except ValueError:
+                break
+            entries[kind, key] = value
+            good += len(line) + 1
+        started = entries.pop(('run', ''), 0)
+        if started < time.time() - JOURNAL_MAX_AGE:
+            self.stale = bool(entries)
+            return
+        if good < len(data):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)  # a batch cut short by the crash
+        self.entries = entries
+        self.replayed = len(entries)
+
+    def get(self, kind, key):
+        """The value recorded for (kind, key), or None"""
+        value = self.entries.get((kind, key))
+        if value is not None:
+            self.hits += 1
+        return value
+
+    def record(self, kind, key, value):
+        self.entries[kind, key] = value
+        self.buffer.append(json.dumps([kind, key, value], ensure_ascii=False, separators=(',', ':')))
+        self.recorded += 1
+        if len(self.buffer) >= JOURNAL_BATCH or time.monotonic() - self.last_flush >= JOURNAL_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        if self.before_flush is not None:
+            self.before_flush()
+        self.file.write('\n'.join(self.buffer) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.buffer = []
+        self.flushes += 1
+
+    def close(self, completed=False):
+        """Flush what is left; a completed run has nothing to resume, so the journal is removed"""
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+        if completed:
+            os.remove(self.path)
+
+    def summary(self):
+        stale = ', an older stale journal was discarded' if self.stale else ''
+        return (f"Journal: {self.replayed} records replayed, {self.hits} fetches skipped, "
+                f"{self.recorded} recorded in {self.flushes} fsynced batches{stale}")
@@ -0,0 +1,210 @@
+import json
+import time
+import bisect
+from collections import defaultdict
+from atomic_write import write_atomic
+
+# Histogram bucket bounds in seconds, from a DNS cache hit to a slow category
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram that also keeps its samples for exact quantiles"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.samples = []
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.samples.append(value)
+        self.total += value
+
+    def quantile(self, q):
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))] if ordered else 0.0
+
+    def describe(self):
+        n = len(self.samples)
+        return {
+            'count': n,
+            'sum': round(self.total, 6),
+            'mean': round(self.total / n, 6) if n else 0.0,
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'max': round(max(self.samples), 6) if n else 0.0,
+        }
+
+
+class RunMetrics:
+    """Where a run's seconds go: request stages, parse calls, rendering and categories
+
+    Request stages (dns, connect, ttfb) come from an aiohttp TraceConfig on
+    each session; download, parse and render times are reported by the code
+    doing the work. write() emits a JSON run report and a Prometheus textfile
+    (for node_exporter's textfile collector).
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.wall = None
+        self.stages = defaultdict(Histogram)  # (stage, kind) -> histogram
+        self.departments = defaultdict(Histogram)  # (market, department) -> histogram
+        self.categories = []
+        self.requests = defaultdict(int)  # (kind, status) -> count
+        self.failures = defaultdict(int)  # (kind, reason) -> count
+
+    def observe(self, stage, kind, seconds):
+        self.stages[stage, kind].observe(seconds)
+
+    def failure(self, kind, reason):
+        self.failures[kind, reason] += 1
+
+    def category(self, market, category, seconds, products):
+        # Crawled subcategories ("Dept › Sub › Leaf") share their department's histogram
+        department = category.split(' › ')[0]
+        self.departments[market, department].observe(seconds)
+        self.categories.append({'market': market, 'category': category,
+                                'seconds': round(seconds, 6), 'products': products})
+
+    def trace_config(self):
+        """TraceConfig recording DNS, connect and time to first byte of every request
+
+        Pass trace_request_ctx={'kind': ...} to session.get to label a request.
+        """
+        import aiohttp
+        config = aiohttp.TraceConfig()
+        config.on_request_start.append(self._on_request_start)
+        config.on_dns_resolvehost_start.append(self._on_dns_start)
+        config.on_dns_resolvehost_end.append(self._on_dns_end)
+        config.on_connection_create_start.append(self._on_connect_start)
+        config.on_connection_create_end.append(self._on_connect_end)
+        config.on_request_end.append(self._on_request_end)
+        config.on_request_exception.append(self._on_request_exception)
+        return config
+
+    @staticmethod
+    def _kind(trace_ctx):
+        request_ctx = trace_ctx.trace_request_ctx
+        return request_ctx.get('kind', 'other') if isinstance(request_ctx, dict) else 'other'
+
+    async def _on_request_start(self, session, trace_ctx, params):
+        trace_ctx.sent_at = time.perf_counter()
+
+    async def _on_dns_start(self, session, trace_ctx, params):
+        trace_ctx.dns_at = time.perf_counter()
+
+    async def _on_dns_end(self, session, trace_ctx, params):
+        self.observe('dns', self._kind(trace_ctx), time.perf_counter() - trace_ctx.dns_at)
+
+    async def _on_connect_start(self, session, trace_ctx, params):
+        trace_ctx.connect_at = time.perf_counter()
+
+    async def _on_connect_end(self, session, trace_ctx, params):
+        # Includes DNS and the TLS handshake; pooled connections skip this stage
+        now = time.perf_counter()
+        self.observe('connect', self._kind(trace_ctx), now - trace_ctx.connect_at)
+        trace_ctx.sent_at = now
+
+    async def _on_request_end(self, session, trace_ctx, params):
+        kind = self._kind(trace_ctx)
+        self.observe('ttfb', kind, time.perf_counter() - trace_ctx.sent_at)
+        self.requests[kind, str(params.response.status)] += 1
+
+    async def _on_request_exception(self, session, trace_ctx, params):
+        self.requests[self._kind(trace_ctx), type(params.exception).__name__] += 1
+
+    def finish(self):
+        self.wall = time.perf_counter() - self.start
+
+    def report(self):
+        wall = self.wall if self.wall is not None else time.perf_counter() - self.start
+        stages = defaultdict(dict)
+        for (stage, kind), hist in sorted(self.stages.items()):
+            stages[stage][kind] = hist.describe()
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started)),
+            'wall_seconds': round(wall, 6),
+            'requests': _by_kind(self.requests),
+            'failures': _by_kind(self.failures),
+            'stages': stages,
+            'departments': {
+                f'{market}/{department}': hist.describe()
+                for (market, department), hist in sorted(self.departments.items())
+            },
+            'categories': self.categories,
+        }
+
+    def prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        report = self.report()
+        lines = [
+            '# HELP amz_run_duration_seconds Wall time of the last run.',
+            '# TYPE amz_run_duration_seconds gauge',
+            f'amz_run_duration_seconds {report["wall_seconds"]}',
+            '# HELP amz_run_timestamp_seconds When the last run started.',
+            '# TYPE amz_run_timestamp_seconds gauge',
+            f'amz_run_timestamp_seconds {self.started:.0f}',
+            '# HELP amz_requests_total Requests by kind and HTTP status or exception.',
+            '# TYPE amz_requests_total counter',
+        ]
+        lines += [f'amz_requests_total{_labels(kind=k, status=s)} {n}'
+                  for (k, s), n in sorted(self.requests.items())]
+        lines += ['# HELP amz_failures_total Failed fetches by kind and reason.',
+                  '# TYPE amz_failures_total counter']
+        lines += [f'amz_failures_total{_labels(kind=k, reason=r)} {n}'
+                  for (k, r), n in sorted(self.failures.items())]
+        lines += _histogram('amz_stage_seconds', 'Request stages, parse calls and rendering.',
+                            {_labels(stage=s, kind=k): h for (s, k), h in sorted(self.stages.items())})
+        lines += _histogram('amz_category_seconds', 'Time to list a category, by department.',
+                            {_labels(market=m, department=d): h
+                             for (m, d), h in sorted(self.departments.items())})
+        return '\n'.join(lines) + '\n'
+
+    def write(self, report_path=None, textfile_path=None):
+        if report_path:
+            write_atomic(report_path, json.dumps(self.report(), indent=2, ensure_ascii=False) + '\n')
+        if textfile_path:
+            write_atomic(textfile_path, self.prometheus())
+
+    def summary(self):
+        parts = [f"{stage} p95 {hist.quantile(0.95) * 1000:.1f}ms"
+                 for stage, hist in sorted(_by_stage(self.stages).items())]
+        failed = sum(self.failures.values())
+        return f"Run metrics: {', '.join(parts) or 'nothing recorded'}; {failed} failed fetches"
+
+
+def _by_kind(counts):
+    nested = defaultdict(dict)
+    for (kind, key), n in sorted(counts.items()):
+        nested[kind][key] = n
+    return nested
+
+
+def _by_stage(stages):
+    merged = defaultdict(Histogram)
+    for (stage, _), hist in stages.items():
+        merged[stage].samples.extend(hist.samples)
+    return merged
+
+
+def _labels(**labels):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def _histogram(name, help_text, series):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, hist in series.items():
+        inner = labels[1:-1] + ',' if labels != '{}' else ''
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), hist.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{inner}le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{labels} {hist.total:.6f}')
+        lines.append(f'{name}_count{labels} {len(hist.samples)}')
+    return lines
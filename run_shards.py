@@ -0,0 +1,115 @@
+import json
+import time
+import hashlib
+from atomic_write import write_atomic
+
+# Shards without a run id must have started within this many seconds of each other to be merged
+SHARD_WINDOW = 2 * 60 * 60
+
+
+def parse_shard(text):
+    """Parse 'i/N' (0 <= i < N) into (i, N)"""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"shard must look like i/N, got {text!r}") from None
+    if not 0 <= index < count:
+        raise ValueError(f"shard index must be in 0..{count - 1}, got {index}")
+    return index, count
+
+
+def shard_of(key, count):
+    """Shard a category belongs to: a hash of its key, so the same on every machine and run"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+
+class ShardResult:
+    """One shard's part of a run: the categories it owns, their products and Amazon ranks
+
+    Categories are assigned to shards by shard_of a key of their bestseller
+    list ("se:/gp/bestsellers/books"), so N processes with --shard 0/N ..
+    N-1/N cover each list exactly once, however the crawl happened to find
+    and name it. add() has the signature of RankHistory.add, so the
+    rankings are recorded the same way and committed to the history by the
+    merge step. run_id ties the shards of one run together, see merge_shards.
+    """
+
+    def __init__(self, index, count, started=None, run_id=''):
+        self.index = index
+        self.count = count
+        self.started = int(started if started is not None else time.time())
+        self.run_id = run_id
+        self.categories = {}  # market code -> {category: products}
+        self.ranks = {}  # 'code/category' -> [(rank, asin)]
+        self.labels = {}  # display names of categories keyed by path
+
+    def owns(self, key):
+        return shard_of(key, self.count) == self.index
+
+    def add(self, category, ranked, label=None):
+        self.ranks[category] = [list(entry) for entry in ranked]
+        if label is not None:
+            self.labels[category] = label
+
+    def collect(self, code):
+        """on_category callback storing the finished categories of one marketplace"""
+        categories = self.categories.setdefault(code, {})
+        return categories.__setitem__
+
+    def save(self, path):
+        data = {'shard': [self.index, self.count], 'started': self.started, 'run_id': self.run_id,
+                'categories': self.categories, 'ranks': self.ranks, 'labels': self.labels}
+        write_atomic(path, json.dumps(data, ensure_ascii=False))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        result = cls(*data['shard'], started=data['started'], run_id=data.get('run_id', ''))
+        result.categories = data['categories']
+        result.ranks = data['ranks']
+        result.labels = data.get('labels', {})
+        return result
+
+    def summary(self):
+        total = sum(len(categories) for categories in self.categories.values())
+        return f"Shard {self.index}/{self.count}: {total} categories"
+
+
+def merge_shards(paths):
+    """Combine the result files of all N shards of a run into one ShardResult
+
+    Raises ValueError unless every shard 0..N-1 is present exactly once and
+    all come from the same run: they must have the same run id, or without
+    one, have started within SHARD_WINDOW of each other (so a shard file
+    left over from an earlier run is caught). Shards are merged in index
+    order and categories sorted by name, so the result doesn't depend on
+    the order of paths.
+    """
+    shards = sorted((ShardResult.load(path) for path in paths), key=lambda s: s.index)
+    if not shards:
+        raise ValueError("no shard results to merge")
+    count = shards[0].count
+    indexes = [s.index for s in shards]
+    if any(s.count != count for s in shards) or indexes != list(range(count)):
+        found = ', '.join(f'{s.index}/{s.count}' for s in shards)
+        raise ValueError(f"need shards 0/{count} to {count - 1}/{count} exactly once, got {found}")
+    run_ids = {s.run_id for s in shards}
+    if len(run_ids) > 1:
+        found = ', '.join(f'{s.index}/{s.count}: {s.run_id or "none"}' for s in shards)
+        raise ValueError(f"shards come from different runs (run ids {found})")
+    started = [s.started for s in shards]
+    if not shards[0].run_id and max(started) - min(started) > SHARD_WINDOW:
+        raise ValueError(f"shards started {(max(started) - min(started)) / 3600:.1f} hours apart, "
+                         f"they are not from one run (give the shards of a run the same run id)")
+    merged = ShardResult(0, 1, started=min(started), run_id=shards[0].run_id)
+    for shard in shards:
+        for code, categories in shard.categories.items():
+            merged.categories.setdefault(code, {}).update(categories)
+        merged.ranks.update(shard.ranks)
+        merged.labels.update(shard.labels)
+    merged.categories = {code: dict(sorted(categories.items()))
+                         for code, categories in sorted(merged.categories.items())}
+    merged.ranks = dict(sorted(merged.ranks.items()))
+    return merged
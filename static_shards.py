@@ -0,0 +1,86 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+from atomic_write import write_atomic
+
+try:
+    import brotli
+except ImportError:  # shards are only precompressed with gzip
+    brotli = None
+
+# Shards no page has referenced for this long are deleted; they are kept a
+# while so visitors holding an older shell page can still load theirs
+PRUNE_AFTER = 2 * 24 * 60 * 60
+
+
+class ShardWriter:
+    """Writes one marketplace's category data as content-addressed JSON files
+
+    Each shard is named by a hash of its content ("se-1a2b3c4d5e6f7a8b.json"),
+    so it never changes once published and can be cached forever. A .gz
+    (and, with the brotli package, a .br) copy is written next to it for
+    servers that serve precompressed files. Unchanged shards are reused as
+    they are.
+    """
+
+    def __init__(self, out_dir, prefix, url_prefix='data/'):
+        self.out_dir = out_dir
+        self.prefix = prefix  # shards of different marketplaces share out_dir
+        self.url_prefix = url_prefix
+        self.used = set()
+        self.written = 0
+        self.reused = 0
+        self.pruned = 0
+        self.bytes = {'json': 0, 'gz': 0, 'br': 0}
+
+    def write(self, data):
+        """Store data as a shard unless an identical one exists; returns its URL"""
+        blob = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        name = f'{self.prefix}-{hashlib.sha256(blob).hexdigest()[:16]}.json'
+        path = os.path.join(self.out_dir, name)
+        self.used.add(name)
+        suffixes = ('', '.gz', '.br') if brotli is not None else ('', '.gz')
+        if all(os.path.exists(path + suffix) for suffix in suffixes):
+            now = time.time()
+            for suffix in suffixes:
+                os.utime(path + suffix, (now, now))  # still in use, see prune()
+            self.reused += 1
+            return self.url_prefix + name
+        # gzip without a timestamp, so the same shard always compresses to the same bytes
+        variants = {'json': blob, 'gz': gzip.compress(blob, 9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(blob, quality=11)
+        os.makedirs(self.out_dir, exist_ok=True)
+        for suffix, (kind, data) in zip(suffixes, variants.items()):
+            write_atomic(path + suffix, data)
+            self.bytes[kind] += len(data)
+        self.written += 1
+        return self.url_prefix + name
+
+    def prune(self):
+        """Delete this prefix's shards that weren't used this run and haven't been for a while"""
+        cutoff = time.time() - PRUNE_AFTER
+        try:
+            names = os.listdir(self.out_dir)
+        except OSError:
+            return
+        for name in names:
+            base = name[:-3] if name.endswith(('.gz', '.br')) else name
+            if not base.startswith(self.prefix + '-') or base in self.used:
+                continue
+            path = os.path.join(self.out_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    self.pruned += name == base  # count shards, not their compressed copies
+            except OSError:
+                pass
+
+    def summary(self):
+        compressed = '' if not self.written else (
+            f" ({self.bytes['json'] / 1024:.1f} KB, {self.bytes['gz'] / 1024:.1f} KB gzipped"
+            + (f", {self.bytes['br'] / 1024:.1f} KB brotli" if brotli is not None else '') + ')')
+        return (f"Shards [{self.prefix}]: {self.written} written{compressed}, "
+                f"{self.reused} unchanged, {self.pruned} pruned")
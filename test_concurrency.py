@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from concurrency import AdaptiveLimiter
+
+
+def test_healthy_responses_grow_the_limit_by_one_over_the_limit():
+    limiter = AdaptiveLimiter(initial=2, max_limit=32)
+
+    async def run():
+        for _ in range(4):
+            await limiter.acquire('h')
+            limiter.release('h', 'ok', 0.01)
+
+    asyncio.run(run())
+    expected = 2.0
+    for _ in range(4):
+        expected += 1 / expected
+    assert limiter.hosts['h'].limit == pytest.approx(expected)
+
+
+def test_slow_responses_and_max_limit_stop_growth():
+    limiter = AdaptiveLimiter(initial=2, max_limit=2.5)
+
+    async def run():
+        await limiter.acquire('h')
+        limiter.release('h', 'ok', 0.01)
+        for _ in range(5):
+            await limiter.acquire('h')
+            limiter.release('h', 'ok', 1.0)  # 100x the best latency
+
+    asyncio.run(run())
+    assert limiter.hosts['h'].limit == 2.5
+
+
+def test_throttling_halves_once_per_window_down_to_min_limit():
+    limiter = AdaptiveLimiter(initial=8, min_limit=3)
+
+    async def run():
+        for _ in range(3):
+            await limiter.acquire('h')
+        for _ in range(3):
+            limiter.release('h', 'throttled')
+
+    asyncio.run(run())
+    state = limiter.hosts['h']
+    assert state.limit == 4 and state.cuts == 1
+    state.last_cut -= 1  # a window later
+    asyncio.run(limiter.acquire('h'))
+    limiter.release('h', 'throttled')
+    assert state.limit == 3 and state.cuts == 2
+
+
+def test_waiters_get_slots_in_order_as_they_free_up():
+    limiter = AdaptiveLimiter(initial=1)
+    order = []
+
+    async def request(name):
+        await limiter.acquire('h')
+        order.append(name)
+        await asyncio.sleep(0)
+        limiter.release('h', 'neutral')
+
+    async def run():
+        await asyncio.gather(*(request(i) for i in range(4)))
+
+    asyncio.run(run())
+    assert order == [0, 1, 2, 3]
+    assert limiter.hosts['h'].in_flight == 0
+
+
+def test_cancelled_waiter_gives_no_slot_away():
+    limiter = AdaptiveLimiter(initial=1)
+
+    async def run():
+        await limiter.acquire('h')
+        waiter = asyncio.ensure_future(limiter.acquire('h'))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release('h', 'neutral')
+
+    asyncio.run(run())
+    assert limiter.hosts['h'].in_flight == 0 and not limiter.hosts['h'].waiters
@@ -0,0 +1,61 @@
+"""The fast extractors against BeautifulSoup on the bench fixtures (bench/bench_extract.py as a test)"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('bs4')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench'))
+
+import bench_extract
+import fetch_bestsellers
+from fast_extract import AsinScanner, extract_subcategories
+from product_store import ProductStore
+
+ASIN, URL = 'B000TEST00', 'https://www.amazon.se/dp/B000TEST00'
+PRODUCT_PAGES = bench_extract.load_fixtures('product_')
+CATEGORY_PAGES = bench_extract.load_fixtures('category_')
+
+
+@pytest.mark.parametrize('name', sorted(PRODUCT_PAGES))
+def test_product_fields_match_soup(name):
+    html_text = PRODUCT_PAGES[name]
+    assert (fetch_bestsellers.parse_product_from_html(html_text, ASIN, URL)
+            == bench_extract.parse_with_soup_only(html_text, ASIN, URL))
+
+
+@pytest.mark.parametrize('name', sorted(CATEGORY_PAGES))
+@pytest.mark.parametrize('limit', (12, 15, 50))
+@pytest.mark.parametrize('chunk_size', (1, 997, 1 << 20))
+def test_asin_scanner_matches_soup(name, limit, chunk_size):
+    html_text = CATEGORY_PAGES[name]
+    scanned, _ = bench_extract.scan_in_chunks(html_text.encode('utf-8'), limit, chunk_size)
+    assert scanned == fetch_bestsellers.parse_asins_soup(html_text, limit)
+
+
+def test_asin_scanner_skips_comments_scripts_and_data_href():
+    page = (b'<!-- <div data-asin="B0COMMENT1"> --><script>x = \'<div data-asin="B0SCRIPTA1">\'</script>'
+            b'<a data-href="/dp/B0DATAHRF1" href="/help">x</a><div data-asin="B0REALASIN"></div>'
+            b'<a class="x" href="/dp/B0LINKASIN">y</a>')
+    scanner = AsinScanner(10)
+    for i in range(len(page)):
+        scanner.feed(page[i:i + 1])
+    scanner.close()
+    assert scanner.result() == ['B0REALASIN', 'B0LINKASIN']
+
+
+def test_subcategories_ignore_data_href():
+    page = (b'<a data-href="/gp/bestsellers/beauty/111" href="/help">Help</a>'
+            b'<a class="x" href="/gp/bestsellers/beauty/222/ref=zg_bs_nav_0">Hair &amp; Nails</a>')
+    assert extract_subcategories(page) == [('/gp/bestsellers/beauty/222', 'Hair & Nails')]
+
+
+@pytest.mark.parametrize('name', sorted(CATEGORY_PAGES))
+def test_category_only_lists_and_stores_no_gift_cards(name, tmp_path):
+    store = ProductStore(str(tmp_path / 'products.sqlite'))
+    products = bench_extract.list_category_only(CATEGORY_PAGES[name].encode('utf-8'), 12, store)
+    store.commit()
+    titles = [p['title'] for p in products] + [t for t, in store.conn.execute("SELECT title FROM products")]
+    store.close()
+    assert not [t for t in titles if any(word in t.lower() for word in fetch_bestsellers.GIFT_CARD_WORDS)]
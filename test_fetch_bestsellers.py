@@ -0,0 +1,95 @@
+import asyncio
+import collections
+import os
+from urllib.parse import urlsplit
+
+import pytest
+
+import fetch_bestsellers
+from fetch_bestsellers import RunContext, crawl_categories, first_valid
+from marketplaces import MARKETPLACES
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench', 'fixtures')
+
+
+def resolving(outcomes):
+    """submit() for first_valid: candidate i resolves after outcomes[i] = (delay, valid)"""
+    submitted = []
+    futures = {}
+
+    async def submit(candidate):
+        submitted.append(candidate)
+        delay, valid = outcomes[candidate]
+        future = asyncio.ensure_future(asyncio.sleep(delay, {'n': candidate} if valid else None))
+        futures[candidate] = future
+        return future
+
+    return submit, submitted, futures
+
+
+def test_first_valid_keeps_candidate_order_and_stops_submitting():
+    # Later candidates finish first, but the first two valid ones in order win
+    submit, submitted, _ = resolving({0: (0.03, True), 1: (0.02, False), 2: (0.01, True),
+                                      3: (0, True), 4: (0, True), 5: (0, True)})
+    stats = {'skipped': 0, 'cancelled': 0}
+    results = asyncio.run(first_valid(list(range(6)), 2, 1, submit, stats))
+    assert results == [{'n': 0}, {'n': 2}]
+    assert submitted == [0, 1, 2, 3]  # limit + lookahead in flight, one more for the invalid one
+    assert stats == {'skipped': 2, 'cancelled': 0}
+
+
+def test_first_valid_cancels_what_is_still_outstanding():
+    submit, _, futures = resolving({0: (0, True), 1: (0, True), 2: (10, True)})
+    stats = {'skipped': 0, 'cancelled': 0}
+
+    async def run():
+        results = await asyncio.wait_for(first_valid([0, 1, 2], 2, 1, submit, stats), 2)
+        await asyncio.sleep(0)
+        return results
+
+    assert asyncio.run(run()) == [{'n': 0}, {'n': 1}]
+    assert futures[2].cancelled()
+    assert stats == {'skipped': 0, 'cancelled': 1}
+
+
+def test_first_valid_returns_fewer_when_candidates_run_out():
+    submit, submitted, _ = resolving({0: (0, False), 1: (0, True), 2: (0, False)})
+    assert asyncio.run(first_valid([0, 1, 2], 2, 1, submit)) == [{'n': 1}]
+    assert submitted == [0, 1, 2]
+
+
+def test_crawl_fetches_each_list_page_once(monkeypatch):
+    with open(os.path.join(FIXTURES_DIR, 'category_beauty.html'), 'rb') as f:
+        page = f.read()
+    requests = collections.Counter()
+
+    async def fetch_page(session, url, kind, ctx=None, make_scanner=None, cache_partial=False):
+        requests[kind, url] += 1
+        if kind != 'category':
+            return None, None
+        _, _, department, node = (urlsplit(url).path.split('/') + [''])[:4]
+        tree = ''.join(f'<li><a href="/gp/bestsellers/{department}/{node or 1}{i}">{department} {node}{i}</a></li>'
+                       for i in range(3))
+        body = page.replace(b'<body>', b'<body><div role="tree"><ul>' + tree.encode() + b'</ul></div>', 1)
+        scanner = make_scanner() if make_scanner is not None else None
+        if scanner is not None:
+            scanner.feed(body)
+        return body, scanner
+
+    monkeypatch.setattr(fetch_bestsellers, 'fetch_page', fetch_page)
+    monkeypatch.setattr(fetch_bestsellers, 'CRAWL_DEPTH', 2)
+    monkeypatch.setattr(fetch_bestsellers, 'CRAWL_MAX_PAGES', 10)
+    ctx = RunContext(category_only=True, market=MARKETPLACES['se'])
+    seeds = [(name, f'{ctx.base_url}/gp/bestsellers/{name}') for name in ('beauty', 'books')]
+    listed = {}
+    pages = asyncio.run(crawl_categories(None, seeds, ctx, listed.__setitem__))
+
+    category_requests = {url: n for (kind, url), n in requests.items() if kind == 'category'}
+    assert pages == 10 and len(listed) == 10
+    assert len(category_requests) == 10 and set(category_requests.values()) == {1}
+    assert all(listed.values())
+
+
+@pytest.mark.parametrize('title', ['Amazon.se Presentkort', 'Gift Card'])
+def test_make_product_filters_gift_cards(title):
+    assert fetch_bestsellers.make_product('B1', 'u', title, 'i') is None
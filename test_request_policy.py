@@ -0,0 +1,69 @@
+import asyncio
+
+from request_policy import RequestPolicy, RetryBudget
+
+
+def failing_then(good_after):
+    """Attempt that fails (None) until its good_after-th call"""
+    calls = []
+
+    async def attempt(started):
+        started()
+        calls.append(1)
+        return 'ok' if len(calls) > good_after else None
+
+    return attempt, calls
+
+
+def should_retry(result):
+    return result is None
+
+
+def test_retries_until_success():
+    attempt, calls = failing_then(2)
+    policy = RequestPolicy(max_attempts=3, base_delay=0, budget=10)
+    assert asyncio.run(policy.run(attempt, should_retry)) == 'ok'
+    assert len(calls) == 3 and policy.stats['retries'] == 2 and policy.budget.left == 8
+
+
+def test_max_attempts_bounds_the_retries():
+    attempt, calls = failing_then(10)
+    policy = RequestPolicy(max_attempts=3, base_delay=0, budget=10)
+    assert asyncio.run(policy.run(attempt, should_retry)) is None
+    assert len(calls) == 3
+
+
+def test_budget_is_shared_by_the_policies_of_a_run():
+    budget = RetryBudget(1)
+    first, second = (RequestPolicy(max_attempts=5, base_delay=0, budget=budget) for _ in range(2))
+    attempt, calls = failing_then(10)
+    asyncio.run(first.run(attempt, should_retry))
+    asyncio.run(second.run(attempt, should_retry))
+    assert len(calls) == 3  # one retry in total, then each policy gives up after its first failure
+    assert budget.left == 0 and budget.exhausted == 2
+
+
+def test_slow_request_is_hedged_and_the_faster_attempt_wins():
+    policy = RequestPolicy(max_attempts=1, budget=5, hedge=True, hedge_min_samples=10)
+    for _ in range(10):
+        policy.observe(0.01)
+    calls = []
+
+    async def attempt(started):
+        started()
+        calls.append(1)
+        await asyncio.sleep(5 if len(calls) == 1 else 0)
+        return f'attempt {len(calls)}'
+
+    async def run():
+        return await asyncio.wait_for(policy.run(attempt, should_retry), 2)
+
+    assert asyncio.run(run()) == 'attempt 2'
+    assert policy.stats['hedges'] == 1 and policy.stats['hedge_wins'] == 1 and policy.budget.left == 4
+
+
+def test_no_hedge_without_enough_latency_samples():
+    policy = RequestPolicy(max_attempts=1, budget=5, hedge=True, hedge_min_samples=10)
+    attempt, calls = failing_then(0)
+    assert asyncio.run(policy.run(attempt, should_retry)) == 'ok'
+    assert len(calls) == 1 and policy.stats['hedges'] == 0 and policy.budget.left == 5
@@ -0,0 +1,96 @@
+import json
+import os
+import time
+
+import run_journal
+from run_journal import RunJournal
+
+
+def test_resume_replays_recorded_fetches(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = RunJournal(path)
+    journal.record('ranked', 'se:/books', ['B1', 'B2'])
+    journal.record('product', 'se:B1', {'asin': 'B1'})
+    journal.close()
+
+    resumed = RunJournal(path, resume=True)
+    assert resumed.replayed == 2
+    assert resumed.get('ranked', 'se:/books') == ['B1', 'B2']
+    assert resumed.get('product', 'se:B2') is None
+    assert resumed.hits == 1
+    resumed.close()
+
+
+def test_without_resume_the_journal_starts_over(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = RunJournal(path)
+    journal.record('links', 'se:/books', [])
+    journal.close()
+    fresh = RunJournal(path)
+    assert fresh.get('links', 'se:/books') is None
+    fresh.close()
+
+
+def test_a_line_cut_short_by_a_crash_is_dropped_and_truncated(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = RunJournal(path)
+    journal.record('product', 'se:B1', {'asin': 'B1'})
+    journal.close()
+    good_size = os.path.getsize(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('["product","se:B2",{"as')
+
+    resumed = RunJournal(path, resume=True)
+    assert resumed.get('product', 'se:B1') == {'asin': 'B1'}
+    assert resumed.get('product', 'se:B2') is None
+    assert os.path.getsize(path) == good_size
+    resumed.record('product', 'se:B3', {'asin': 'B3'})
+    resumed.close()
+    assert RunJournal(path, resume=True).get('product', 'se:B3') == {'asin': 'B3'}
+
+
+def test_stale_journal_is_not_resumed(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(['run', '', int(time.time() - run_journal.JOURNAL_MAX_AGE - 60)]) + '\n')
+        f.write(json.dumps(['product', 'se:B1', {'asin': 'B1'}]) + '\n')
+    journal = RunJournal(path, resume=True)
+    assert journal.stale and journal.replayed == 0
+    assert journal.get('product', 'se:B1') is None
+    journal.close()
+
+
+def test_records_are_written_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_journal, 'JOURNAL_BATCH', 3)
+    monkeypatch.setattr(run_journal, 'JOURNAL_FLUSH_SECONDS', 3600)
+    path = str(tmp_path / 'journal.jsonl')
+    journal = RunJournal(path)
+    for i in range(5):
+        journal.record('product', f'se:B{i}', {})
+    assert journal.flushes == 1
+    with open(path, encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == 1 + 3
+    journal.close()
+    assert journal.flushes == 2
+
+
+def test_before_flush_runs_before_the_batch_is_written(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    seen = []
+
+    def before_flush():
+        with open(path, encoding='utf-8') as f:
+            seen.append('se:B1' in f.read())
+
+    journal = RunJournal(path, before_flush=before_flush)
+    journal.record('product', 'se:B1', {})
+    journal.close()
+    assert seen == [False]
+
+
+def test_completed_run_removes_the_journal(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = RunJournal(path)
+    journal.record('product', 'se:B1', {})
+    journal.close(completed=True)
+    assert not os.path.exists(path)
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+import run_shards
+from run_shards import ShardResult, merge_shards, parse_shard, shard_of
+
+
+def save_shards(tmp_path, specs):
+    """Write ShardResults for (index, count, started, run_id) and return their paths"""
+    paths = []
+    for index, count, started, run_id in specs:
+        result = ShardResult(index, count, started, run_id)
+        result.categories = {'se': {f'List {index}': [{'asin': f'B{index}'}]}}
+        result.add(f'se:/list-{index}', [(1, f'B{index}')], label=f'List {index}')
+        path = str(tmp_path / f'shard-{index}-of-{count}-{len(paths)}.json')
+        result.save(path)
+        paths.append(path)
+    return paths
+
+
+def test_parse_shard():
+    assert parse_shard('1/3') == (1, 3)
+    for text in ('3/3', '-1/3', 'a/b', '1'):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+
+def test_shard_of_is_stable_and_covers_every_shard():
+    keys = [f'se:/gp/bestsellers/books/{i}' for i in range(200)]
+    assert [shard_of(k, 4) for k in keys] == [shard_of(k, 4) for k in keys]
+    assert {shard_of(k, 4) for k in keys} == {0, 1, 2, 3}
+
+
+def test_merge_combines_all_shards_whatever_the_order(tmp_path):
+    now = time.time()
+    paths = save_shards(tmp_path, [(1, 2, now, 'r1'), (0, 2, now - 60, 'r1')])
+    merged = merge_shards(paths)
+    assert list(merged.categories['se']) == ['List 0', 'List 1']
+    assert list(merged.ranks) == ['se:/list-0', 'se:/list-1']
+    assert merged.labels == {'se:/list-0': 'List 0', 'se:/list-1': 'List 1'}
+    assert merged.started == int(now - 60) and merged.run_id == 'r1'
+    assert merge_shards(list(reversed(paths))).categories == merged.categories
+
+
+@pytest.mark.parametrize('specs', [
+    [(0, 3, None, ''), (1, 3, None, '')],  # shard 2 missing
+    [(0, 2, None, ''), (0, 2, None, ''), (1, 2, None, '')],  # shard 0 twice
+    [(0, 2, None, ''), (1, 3, None, '')],  # different N
+    [(0, 2, None, 'a'), (1, 2, None, 'b')],  # different runs
+    [(0, 2, None, 'a'), (1, 2, None, '')],
+    [],
+])
+def test_merge_rejects_an_incomplete_or_mixed_set(tmp_path, specs):
+    with pytest.raises(ValueError):
+        merge_shards(save_shards(tmp_path, specs))
+
+
+def test_shards_without_run_id_must_start_close_together(tmp_path):
+    now = time.time()
+    stale = now - run_shards.SHARD_WINDOW - 60
+    with pytest.raises(ValueError):
+        merge_shards(save_shards(tmp_path, [(0, 2, stale, ''), (1, 2, now, '')]))
+    # With a run id the start times don't matter, e.g. a shard retried much later
+    merge_shards(save_shards(tmp_path, [(0, 2, stale, 'r1'), (1, 2, now, 'r1')]))